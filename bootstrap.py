@@ -0,0 +1,77 @@
+"""
+Shared startup helpers for the multicam view application.
+
+camera_manager.py, cam.py and run.py all prepare logging and directories at
+startup. Doing it here keeps them from repeating the same filesystem calls
+and from attaching logging handlers more than once.
+"""
+import logging
+import os
+from pathlib import Path
+
+LOG_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+def setup_logging(log_file=None):
+    """
+    Configure root logging once per process.
+    
+    The console handler is added only if the root logger has no handlers
+    yet, and a file handler only if none is writing to log_file already,
+    so calling this from every entry module is safe.
+    
+    Parameters:
+    -----------
+    log_file : str or None
+        Also write log records to this file
+    
+    Returns:
+    --------
+    None
+    """
+    root = logging.getLogger()
+    formatter = logging.Formatter(LOG_FORMAT)
+    
+    if not root.handlers:
+        root.setLevel(logging.INFO)
+        handler = logging.StreamHandler()
+        handler.setFormatter(formatter)
+        root.addHandler(handler)
+    
+    if log_file is not None:
+        log_path = os.path.abspath(log_file)
+        if not any(isinstance(h, logging.FileHandler) and h.baseFilename == log_path
+                   for h in root.handlers):
+            file_handler = logging.FileHandler(log_path)
+            file_handler.setFormatter(formatter)
+            root.addHandler(file_handler)
+
+def ensure_dir(path, mode):
+    """
+    Create a directory if needed and make sure it has the given permissions.
+    
+    One mkdir covers both the existence check and the creation; chmod is only
+    called when the permissions actually differ (mkdir's mode is filtered by
+    the umask and ignored for existing directories).
+    
+    Parameters:
+    -----------
+    path : str or pathlib.Path
+        Directory to create
+    mode : int
+        Permission bits, e.g. 0o755
+    
+    Returns:
+    --------
+    pathlib.Path
+        The directory
+    
+    Raises:
+    -------
+    OSError
+        If the directory cannot be created or its permissions set
+    """
+    path = Path(path)
+    path.mkdir(mode=mode, parents=True, exist_ok=True)
+    if path.stat().st_mode & 0o777 != mode:
+        os.chmod(path, mode)
+    return path
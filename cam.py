@@ -1,19 +1,23 @@
 from flask import Flask, render_template, Response, jsonify, send_from_directory
 import io
 import os
+import atexit
+import stat
 import time
 import logging
+import threading
+import functools
+from concurrent.futures import ThreadPoolExecutor
 import traceback
 import gc  # for garbage collection
 import psutil  # for memory monitoring - you may need to install this with pip/poetry
+import numpy as np
 from PIL import Image, ImageDraw
 from camera_manager import CameraManager, CONFIG
+from bootstrap import setup_logging, ensure_dir
 
 # Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
+setup_logging()
 logger = logging.getLogger('multicam_app')
 
 # Application configuration
@@ -24,6 +28,14 @@ APP_CONFIG = {
     "CYCLE_INTERVAL": 2.0,  # seconds between camera cycling
     "DIR_PERMISSIONS": 0o755,  # directory permissions
     "FILE_PERMISSIONS": 0o644,  # file permissions
+    # Extra Image.save() options for saved captures; empty keeps Pillow's defaults
+    # (quality 75, baseline). {"optimize": True, "progressive": True} gives 5-15%
+    # smaller files, at the cost of extra CPU and memory per full-resolution save
+    "JPEG_SAVE_OPTIONS": {},
+    # Concurrent JPEG saves per capture; 1 saves in the request thread. Each extra
+    # worker adds a full-resolution encode to peak memory (~37 MB of coefficients
+    # when progressive), so only raise it on boards with memory to spare
+    "SAVE_WORKERS": 1,
 }
 
 app = Flask(__name__)
@@ -31,20 +43,13 @@ app = Flask(__name__)
 # Use absolute path for captures folder
 captures_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'captures')
 app.config['CAPTURE_FOLDER'] = captures_dir
-logger.info(f"Using captures directory: {captures_dir}")
+logger.info("Using captures directory: %s", captures_dir)
 
-# Create captures directory if it doesn't exist
+# Create captures directory if it doesn't exist, with accessible permissions
 try:
-    if not os.path.exists(app.config['CAPTURE_FOLDER']):
-        logger.info(f"Creating captures directory: {app.config['CAPTURE_FOLDER']}")
-        os.makedirs(app.config['CAPTURE_FOLDER'])
-        # Ensure directory is accessible
-        os.chmod(app.config['CAPTURE_FOLDER'], APP_CONFIG["DIR_PERMISSIONS"])
-        logger.info(f"Set permissions on captures directory")
-    else:
-        logger.info(f"Captures directory exists: {app.config['CAPTURE_FOLDER']}")
+    ensure_dir(app.config['CAPTURE_FOLDER'], APP_CONFIG["DIR_PERMISSIONS"])
 except Exception as e:
-    logger.error(f"Could not set up captures directory: {e}", exc_info=True)
+    logger.error("Could not set up captures directory: %s", e, exc_info=True)
     # Continue anyway - the application will handle missing directory later
 
 # Initialize camera manager
@@ -58,12 +63,170 @@ try:
     )
     # Start cycling through cameras 
     camera_manager.start_camera_cycle(interval=APP_CONFIG["CYCLE_INTERVAL"])
+    # Share one stream of preview frames between all viewers, if enabled
+    if CONFIG["FRAME_SERVER"]:
+        camera_manager.start_frame_server()
     logger.info("Camera manager initialized successfully")
 except Exception as e:
-    logger.error(f"Failed to initialize camera manager: {e}", exc_info=True)
+    logger.error("Failed to initialize camera manager: %s", e, exc_info=True)
     camera_manager = None
     logger.warning("Application will continue without camera functionality")
 
+# The server is threaded so previews keep streaming during a capture; hardware
+# captures still run one at a time, which also keeps capture numbers unique
+capture_slot = threading.BoundedSemaphore(1)
+
+def serialized_capture(view):
+    """
+    Wrap a capture route so it runs while holding capture_slot.
+    
+    Parameters:
+    -----------
+    view : callable
+        Flask view function that drives the cameras
+    
+    Returns:
+    --------
+    callable
+        Wrapped view function
+    """
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        with capture_slot:
+            return view(*args, **kwargs)
+    return wrapper
+
+def save_jpeg(image, filepath):
+    """
+    Save an image to disk as a JPEG using APP_CONFIG["JPEG_SAVE_OPTIONS"].
+    
+    The image is encoded in memory first; the written file is then checked
+    on disk against the encoded size.
+    
+    Parameters:
+    -----------
+    image : PIL.Image
+        RGB image to save
+    filepath : str
+        Destination path
+    
+    Returns:
+    --------
+    int
+        Size of the written file in bytes
+    
+    Raises:
+    -------
+    OSError
+        If the file could not be written, or is missing or short afterwards
+    """
+    buf = io.BytesIO()
+    image.save(buf, format='JPEG', **APP_CONFIG["JPEG_SAVE_OPTIONS"])
+    with open(filepath, 'wb') as f:
+        f.write(buf.getbuffer())
+    
+    # Verify the file actually landed on disk
+    stat_info = stat_or_none(filepath)
+    if stat_info is None or stat_info.st_size != buf.tell():
+        raise OSError(f"File not written completely: {filepath}")
+    return stat_info.st_size
+
+# Pool for parallel saves, created on first use and only if SAVE_WORKERS > 1
+save_pool = None
+save_pool_lock = threading.Lock()
+
+def map_saves(func, *iterables):
+    """
+    Run a save function over its arguments, in parallel if configured.
+    
+    libjpeg releases the GIL while encoding, so with SAVE_WORKERS > 1 the
+    saves run concurrently on save_pool, which is shut down at exit.
+    
+    Parameters:
+    -----------
+    func : callable
+        Save function
+    *iterables : iterable
+        Argument sequences, as for map()
+    
+    Returns:
+    --------
+    list
+        Results of func, in order
+    """
+    global save_pool
+    if APP_CONFIG["SAVE_WORKERS"] <= 1:
+        return list(map(func, *iterables))
+    with save_pool_lock:
+        if save_pool is None:
+            save_pool = ThreadPoolExecutor(max_workers=APP_CONFIG["SAVE_WORKERS"], thread_name_prefix="save")
+            atexit.register(save_pool.shutdown)
+    return list(save_pool.map(func, *iterables))
+
+def save_camera_image(i, img, n, capture_dir):
+    """
+    Save one camera's image from a capture and set its permissions.
+    
+    Parameters:
+    -----------
+    i : int
+        Camera index
+    img : PIL.Image
+        Captured image
+    n : int
+        Capture number
+    capture_dir : str
+        Directory to save into
+    
+    Returns:
+    --------
+    tuple or None
+        (filename, size in bytes) of the saved image, or None if saving failed;
+        successes are logged by the caller in one line per capture
+    """
+    filename = f'capture_{n}_cam{i}.jpg'
+    filepath = os.path.join(capture_dir, filename)
+    try:
+        # Ensure image is in RGB mode for JPEG
+        if img.mode == 'RGBA':
+            img = img.convert('RGB')
+        
+        # Save the image; save_jpeg raises if the file isn't on disk afterwards
+        file_size = save_jpeg(img, filepath)
+        
+        # Ensure file permissions
+        try:
+            os.chmod(filepath, APP_CONFIG["FILE_PERMISSIONS"])
+        except Exception as e:
+            logger.warning("Could not set permissions on %s: %s", filepath, e)
+        
+        return filename, file_size
+    except Exception as e:
+        logger.error("Failed to save image from camera %s: %s", i, e, exc_info=True)
+    return None
+
+def stat_or_none(path):
+    """
+    Stat a path, returning None if it does not exist.
+    
+    Lets the debug routes report existence, size and permissions from one
+    system call instead of an exists() check before each field.
+    
+    Parameters:
+    -----------
+    path : str
+        Path to stat
+    
+    Returns:
+    --------
+    os.stat_result or None
+        Stat result, or None if the path cannot be stat-ed
+    """
+    try:
+        return os.stat(path)
+    except OSError:
+        return None
+
 def get_next_capture_number():
     """
     Get the next capture number for sequential file naming.
@@ -76,7 +239,7 @@ def get_next_capture_number():
     try:
         existing_files = [f for f in os.listdir(app.config['CAPTURE_FOLDER']) 
                         if f.startswith('capture_') and f.endswith('.jpg')]
-        logger.info(f"Found {len(existing_files)} existing capture files")
+        logger.info("Found %s existing capture files", len(existing_files))
         
         # Get capture numbers from both grid and individual files
         numbers = []
@@ -88,13 +251,47 @@ def get_next_capture_number():
                 numbers.append(int(parts[1]))
         
         next_num = max(numbers, default=0) + 1
-        logger.info(f"Next capture number will be: {next_num}")
+        logger.info("Next capture number will be: %s", next_num)
         return next_num
     except Exception as e:
-        logger.error(f"Error getting next capture number: {e}", exc_info=True)
+        logger.error("Error getting next capture number: %s", e, exc_info=True)
         # Fallback to timestamp if there's an error
         return int(time.time())
 
+def add_preview_crosses(image, current_cam, draw=None):
+    """
+    Add the preview crosses for the current camera mode.
+    
+    Single camera mode gets one center cross; four-in-one mode gets a cross
+    in the center of each quadrant.
+    
+    Parameters:
+    -----------
+    image : PIL.Image or numpy.ndarray
+        Frame to draw on; arrays are stamped in place
+    current_cam : int or str
+        Current camera index, or 'all' for four-in-one mode
+    draw : PIL.ImageDraw.ImageDraw or None
+        Existing drawing context for a PIL image
+    """
+    if isinstance(current_cam, int):
+        camera_manager._add_center_cross(image, draw=draw)
+        return
+    
+    # Get dimensions for calculating quadrant centers
+    if isinstance(image, np.ndarray):
+        height, width = image.shape[:2]
+    else:
+        width, height = image.size
+    quadrant_width = width // 2
+    quadrant_height = height // 2
+    
+    for x, y in ((quadrant_width // 2, quadrant_height // 2),
+                 (quadrant_width + quadrant_width // 2, quadrant_height // 2),
+                 (quadrant_width // 2, quadrant_height + quadrant_height // 2),
+                 (quadrant_width + quadrant_width // 2, quadrant_height + quadrant_height // 2)):
+        camera_manager._draw_cross_at(image, x, y, draw=draw)
+
 def gen_frames():
     """
     Generate frames for the video feed.
@@ -126,35 +323,40 @@ def gen_frames():
             if frame_count % 30 == 0:  # Every 30 frames
                 gc.collect()
                 
-            # Capture a frame with the current camera
-            buffer = camera_manager.picam.capture_array()
-            img = Image.fromarray(buffer)
-            
-            # Add camera index indicator and center crosses
-            draw = ImageDraw.Draw(img)
+            # Get a frame with the current camera, shared with other viewers if possible
             current_cam = camera_manager.current_camera
+            frame_server = camera_manager.frame_server
+            if frame_server is not None:
+                buffer = frame_server.wait_for_frame()
+                if buffer is None:
+                    if camera_manager.capturing:
+                        # A still capture holds the camera; skip frames until it's done
+                        time.sleep(APP_CONFIG["FRAME_RATE_SLEEP"])
+                        continue
+                    raise RuntimeError("Timed out waiting for a preview frame")
+                shared = True
+                img = Image.fromarray(buffer)
+                del buffer
+                
+                # Ensure RGB mode; this also copies the frame out of the shared buffer
+                # before drawing on it
+                if img.mode == 'RGBA':
+                    img = img.convert('RGB')
+            else:
+                # A private frame: stamp the crosses straight into the camera buffer
+                # and copy it out once
+                shared = False
+                img = camera_manager.capture_preview_image(
+                    stamp=lambda frame: add_preview_crosses(frame, current_cam))
             
+            # Add camera index indicator and, for shared frames, the center crosses
+            draw = ImageDraw.Draw(img)
+            if shared:
+                add_preview_crosses(img, current_cam, draw=draw)
             if isinstance(current_cam, int):  # Single camera mode
-                # Add camera number indicator
                 draw.text((20, 20), f"Camera {current_cam + 1}", fill=(255, 255, 255))
-                
-                # Add center cross for single camera view
-                camera_manager._add_center_cross(img)
-            else:  # Four-in-one mode - add crosses to each quadrant
-                # Get dimensions for calculating quadrant centers
-                width, height = img.size
-                quadrant_width = width // 2
-                quadrant_height = height // 2
-                
-                # Add a cross to the center of each quadrant
-                camera_manager._draw_cross_at(img, quadrant_width // 2, quadrant_height // 2)
-                camera_manager._draw_cross_at(img, quadrant_width + quadrant_width // 2, quadrant_height // 2)
-                camera_manager._draw_cross_at(img, quadrant_width // 2, quadrant_height + quadrant_height // 2)
-                camera_manager._draw_cross_at(img, quadrant_width + quadrant_width // 2, quadrant_height + quadrant_height // 2)
             
-            # Convert to JPEG bytes (ensuring RGB mode)
-            if img.mode == 'RGBA':
-                img = img.convert('RGB')
+            # Convert to JPEG bytes
             img_io = io.BytesIO()
             img.save(img_io, format='JPEG')
             img_io.seek(0)
@@ -167,7 +369,6 @@ def gen_frames():
                    b'Content-Type: image/jpeg\r\n\r\n' + img_io.getvalue() + b'\r\n')
             
             # Explicitly clean up to prevent memory leaks
-            del buffer
             del img
             del img_io
             
@@ -184,7 +385,7 @@ def gen_frames():
             last_frame_time = time.time()
             
         except Exception as e:
-            logger.error(f"Error generating frame: {e}", exc_info=True)
+            logger.error("Error generating frame: %s", e, exc_info=True)
             # Return an error frame instead of just logging
             try:
                 error_img = Image.new('RGB', (640, 480), color='black')
@@ -196,7 +397,7 @@ def gen_frames():
                 yield (b'--frame\r\n'
                        b'Content-Type: image/jpeg\r\n\r\n' + img_io.getvalue() + b'\r\n')
             except Exception as e2:
-                logger.error(f"Error creating error frame: {e2}", exc_info=True)
+                logger.error("Error creating error frame: %s", e2, exc_info=True)
             
             # Force garbage collection after error
             gc.collect()
@@ -230,6 +431,7 @@ def video_feed():
                     mimetype='multipart/x-mixed-replace; boundary=frame')
 
 @app.route('/capture')
+@serialized_capture
 def capture():
     """
     Capture images from all cameras.
@@ -249,65 +451,38 @@ def capture():
         # Force GC to free up memory before capture
         gc.collect()
         memory_before = psutil.Process().memory_info().rss / (1024 * 1024)  # MB
-        logger.info(f"Memory usage before capture: {memory_before:.2f} MB")
+        logger.info("Memory usage before capture: %.2f MB", memory_before)
         
         # Get next capture number
         n = get_next_capture_number()
-        logger.info(f"Using capture number {n}")
+        logger.info("Using capture number %s", n)
         
         # Check and ensure capture directory exists
         capture_dir = app.config['CAPTURE_FOLDER']
-        logger.info(f"Checking capture directory: {capture_dir}")
+        logger.info("Checking capture directory: %s", capture_dir)
         try:
-            if not os.path.exists(capture_dir):
-                logger.warning(f"Capture directory {capture_dir} does not exist, creating it")
-                os.makedirs(capture_dir, exist_ok=True)
-                os.chmod(capture_dir, APP_CONFIG["DIR_PERMISSIONS"])
-                logger.info(f"Set permissions on capture directory {capture_dir}")
+            # One mkdir both checks for and (re)creates the directory
+            ensure_dir(capture_dir, APP_CONFIG["DIR_PERMISSIONS"])
         except Exception as e:
-            logger.error(f"Could not set up capture directory: {e}", exc_info=True)
+            logger.error("Could not set up capture directory: %s", e, exc_info=True)
             return jsonify({'success': False, 'error': f'Failed to create captures directory: {str(e)}'}), 500
         
         # Capture from all cameras
         logger.info("Capturing images from all cameras")
         try:
             images = camera_manager.capture_all_cameras()
-            logger.info(f"Successfully captured {len(images)} images with dimensions: {[img.size for img in images]}")
+            logger.info("Successfully captured %s images with dimensions: %s", len(images), [img.size for img in images])
         except Exception as e:
-            logger.error(f"Failed to capture all camera images: {e}", exc_info=True)
+            logger.error("Failed to capture all camera images: %s", e, exc_info=True)
             return jsonify({'success': False, 'error': f'Image capture failed: {str(e)}'}), 500
         
-        # Save individual images
-        filenames = []
-        for i, img in enumerate(images):
-            filename = f'capture_{n}_cam{i}.jpg'
-            filepath = os.path.join(capture_dir, filename)
-            logger.info(f"Saving image from camera {i} to {filepath}")
-            try:
-                # Ensure image is in RGB mode for JPEG
-                if img.mode == 'RGBA':
-                    img = img.convert('RGB')
-                
-                # Save the image
-                img.save(filepath)
-                
-                # Verify the file was created
-                if os.path.exists(filepath):
-                    file_size = os.path.getsize(filepath)
-                    logger.info(f"Verified file saved: {filepath} ({file_size} bytes)")
-                    
-                    # Ensure file permissions
-                    try:
-                        os.chmod(filepath, APP_CONFIG["FILE_PERMISSIONS"])
-                    except Exception as e:
-                        logger.warning(f"Could not set permissions on {filepath}: {e}")
-                    
-                    filenames.append(filename)
-                else:
-                    logger.error(f"File not found after save: {filepath}")
-            except Exception as e:
-                logger.error(f"Failed to save image from camera {i}: {e}", exc_info=True)
-                # We'll continue to try saving other images
+        # Save individual images (in parallel if configured); a failed save is
+        # logged and skipped so the other images are still kept
+        saved = [result for result in map_saves(save_camera_image, range(len(images)), images,
+                                                [n] * len(images), [capture_dir] * len(images))
+                 if result is not None]
+        filenames = [filename for filename, _ in saved]
+        logger.info("Saved to %s: %s", capture_dir, saved)
         
         if not filenames:
             logger.error("Failed to save any images")
@@ -335,7 +510,7 @@ def capture():
                         images[i] = None
                         gc.collect()
                 except Exception as crop_error:
-                    logger.error(f"Error cropping image {i}: {crop_error}", exc_info=True)
+                    logger.error("Error cropping image %s: %s", i, crop_error, exc_info=True)
                     # Use original image if cropping fails
                     cropped_images.append(img)
             
@@ -343,46 +518,30 @@ def capture():
             grid_img = camera_manager.create_grid_image(cropped_images)
             grid_filename = f'capture_{n}_grid.jpg'
             grid_filepath = os.path.join(capture_dir, grid_filename)
-            logger.info(f"Saving grid image to {grid_filepath}")
+            logger.info("Saving grid image to %s", grid_filepath)
             
             # Ensure grid image is in RGB mode
             if grid_img.mode == 'RGBA':
                 grid_img = grid_img.convert('RGB')
                 
-            grid_img.save(grid_filepath)
+            # Raises if the grid file isn't on disk afterwards, which clears grid_filename
+            grid_file_size = save_jpeg(grid_img, grid_filepath)
+            logger.info("Verified grid file saved: %s (%s bytes)", grid_filepath, grid_file_size)
             
-            # Verify the grid file was created
-            if os.path.exists(grid_filepath):
-                grid_file_size = os.path.getsize(grid_filepath)
-                logger.info(f"Verified grid file saved: {grid_filepath} ({grid_file_size} bytes)")
-                
-                # Ensure file permissions
-                try:
-                    os.chmod(grid_filepath, APP_CONFIG["FILE_PERMISSIONS"])
-                except Exception as e:
-                    logger.warning(f"Could not set permissions on {grid_filepath}: {e}")
-            else:
-                logger.error(f"Grid file not found after save: {grid_filepath}")
-                grid_filename = None
+            # Ensure file permissions
+            try:
+                os.chmod(grid_filepath, APP_CONFIG["FILE_PERMISSIONS"])
+            except Exception as e:
+                logger.warning("Could not set permissions on %s: %s", grid_filepath, e)
         except Exception as e:
-            logger.error(f"Failed to create or save grid image: {e}", exc_info=True)
+            logger.error("Failed to create or save grid image: %s", e, exc_info=True)
             grid_filename = None
             # We'll still return the individual images if they were saved
         
-        # List the contents of the captures directory to verify
-        try:
-            dir_contents = os.listdir(capture_dir)
-            logger.info(f"Captures directory now contains {len(dir_contents)} files")
-            # Check if our new files are in the directory
-            new_files = [f for f in dir_contents if f'capture_{n}' in f]
-            logger.info(f"New files created: {new_files}")
-        except Exception as e:
-            logger.error(f"Error listing directory contents: {e}", exc_info=True)
-        
         # Force GC again and check memory usage
         gc.collect()
         memory_after = psutil.Process().memory_info().rss / (1024 * 1024)  # MB
-        logger.info(f"Memory usage after capture: {memory_after:.2f} MB (change: {memory_after - memory_before:.2f} MB)")
+        logger.info("Memory usage after capture: %.2f MB (change: %.2f MB)", memory_after, memory_after - memory_before)
         
         logger.info("==== Capture process completed successfully ====")
         return jsonify({
@@ -393,7 +552,37 @@ def capture():
         })
         
     except Exception as e:
-        logger.error(f"Unhandled error during capture: {e}", exc_info=True)
+        logger.error("Unhandled error during capture: %s", e, exc_info=True)
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@app.route('/capture_jpeg/<int:camera_id>')
+@serialized_capture
+def capture_jpeg(camera_id):
+    """
+    Capture a single high-resolution still and return it as a JPEG.
+    
+    Parameters:
+    -----------
+    camera_id : int
+        Index of the camera to capture from
+    
+    Returns:
+    --------
+    Response
+        JPEG image, or JSON error response
+    """
+    if not camera_manager:
+        return jsonify({'success': False, 'error': 'Camera manager not initialized'}), 500
+    
+    if camera_id < 0 or camera_id >= CONFIG["CAMERA_COUNT"]:
+        return jsonify({'success': False, 'error': f'Invalid camera ID: {camera_id}'}), 400
+    
+    try:
+        logger.info("Capturing JPEG from camera %s", camera_id)
+        jpeg = camera_manager.capture_jpeg_bytes(camera_id)
+        return Response(jpeg, mimetype='image/jpeg')
+    except Exception as e:
+        logger.error("Error capturing JPEG from camera %s: %s", camera_id, e, exc_info=True)
         return jsonify({'success': False, 'error': str(e)}), 500
 
 @app.route('/latest_capture')
@@ -409,11 +598,11 @@ def latest_capture():
     try:
         logger.info("Looking for latest capture")
         captures_folder = app.config['CAPTURE_FOLDER']
-        logger.info(f"Scanning captures folder: {captures_folder}")
+        logger.info("Scanning captures folder: %s", captures_folder)
         
         # Check if directory exists first
         if not os.path.exists(captures_folder):
-            logger.warning(f"Captures directory does not exist: {captures_folder}")
+            logger.warning("Captures directory does not exist: %s", captures_folder)
             return jsonify({'success': False, 'error': 'Captures directory not found'}), 404
             
         # Get all grid files
@@ -422,9 +611,9 @@ def latest_capture():
             grid_files = [f for f in all_files 
                         if f.startswith('capture_') and '_grid.jpg' in f]
             
-            logger.info(f"Found {len(grid_files)} grid files out of {len(all_files)} total files")
+            logger.info("Found %s grid files out of %s total files", len(grid_files), len(all_files))
         except Exception as e:
-            logger.error(f"Error listing captures directory: {e}", exc_info=True)
+            logger.error("Error listing captures directory: %s", e, exc_info=True)
             return jsonify({'success': False, 'error': f'Error listing directory: {str(e)}'}), 500
         
         if not grid_files:
@@ -449,17 +638,17 @@ def latest_capture():
                 # Get the filename (second tuple element)
                 latest = capture_numbers[0][1]
                 
-            logger.info(f"Latest grid capture: {latest}")
+            logger.info("Latest grid capture: %s", latest)
             
             # Verify the file exists and is readable
             filepath = os.path.join(captures_folder, latest)
             if not os.path.exists(filepath):
-                logger.error(f"Found latest capture filename {latest}, but file does not exist at {filepath}")
+                logger.error("Found latest capture filename %s, but file does not exist at %s", latest, filepath)
                 return jsonify({'success': False, 'error': 'Latest capture file not found'}), 404
                 
             # Get basic file info for logging
             file_size = os.path.getsize(filepath)
-            logger.info(f"Latest capture file size: {file_size} bytes")
+            logger.info("Latest capture file size: %s bytes", file_size)
             
             return jsonify({
                 'success': True, 
@@ -468,10 +657,10 @@ def latest_capture():
                 'full_path': filepath
             })
         except Exception as e:
-            logger.error(f"Error parsing capture filenames: {e}", exc_info=True)
+            logger.error("Error parsing capture filenames: %s", e, exc_info=True)
             return jsonify({'success': False, 'error': f'Error parsing filenames: {str(e)}'}), 500
     except Exception as e:
-        logger.error(f"Unexpected error getting latest capture: {e}", exc_info=True)
+        logger.error("Unexpected error getting latest capture: %s", e, exc_info=True)
         return jsonify({'success': False, 'error': str(e)}), 500
 
 @app.route('/captures/<path:filename>')
@@ -489,11 +678,11 @@ def serve_capture(filename):
     Response
         File response or JSON error
     """
-    logger.info(f"Request to serve capture file: {filename}")
+    logger.info("Request to serve capture file: %s", filename)
     try:
         return send_from_directory(app.config['CAPTURE_FOLDER'], filename)
     except Exception as e:
-        logger.error(f"Error serving capture file {filename}: {e}", exc_info=True)
+        logger.error("Error serving capture file %s: %s", filename, e, exc_info=True)
         return jsonify({'error': 'File not found'}), 404
 
 @app.route('/camera_info')
@@ -556,7 +745,7 @@ def select_camera(camera_id):
             'was_cycling': was_cycling
         })
     except Exception as e:
-        logger.error(f"Error selecting camera: {e}", exc_info=True)
+        logger.error("Error selecting camera: %s", e, exc_info=True)
         return jsonify({'success': False, 'error': str(e)}), 500
 
 @app.route('/toggle_cycle')
@@ -586,7 +775,7 @@ def toggle_cycle():
             'status': status
         })
     except Exception as e:
-        logger.error(f"Error toggling camera cycle: {e}", exc_info=True)
+        logger.error("Error toggling camera cycle: %s", e, exc_info=True)
         return jsonify({'success': False, 'error': str(e)}), 500
 
 @app.route('/debug/captures')
@@ -601,7 +790,7 @@ def debug_captures():
     """
     try:
         capture_dir = app.config['CAPTURE_FOLDER']
-        logger.info(f"Listing contents of {capture_dir}")
+        logger.info("Listing contents of %s", capture_dir)
         
         # Get directory contents
         if not os.path.exists(capture_dir):
@@ -637,13 +826,14 @@ def debug_captures():
         })
         
     except Exception as e:
-        logger.error(f"Error in debug captures route: {e}", exc_info=True)
+        logger.error("Error in debug captures route: %s", e, exc_info=True)
         return jsonify({
             'success': False,
             'error': str(e)
         }), 500
 
 @app.route('/debug/test_capture')
+@serialized_capture
 def debug_test_capture():
     """
     Debug route to test capturing and saving a single image.
@@ -664,11 +854,11 @@ def debug_test_capture():
         test_filename = f'test_capture_{int(time.time())}.jpg'
         test_filepath = os.path.join(app.config['CAPTURE_FOLDER'], test_filename)
         
-        logger.info(f"Test capture: saving to {test_filepath}")
+        logger.info("Test capture: saving to %s", test_filepath)
         if img.mode == 'RGBA':
             img = img.convert('RGB')
         
-        img.save(test_filepath)
+        save_jpeg(img, test_filepath)
         
         # Get file info
         stat_info = os.stat(test_filepath)
@@ -686,13 +876,14 @@ def debug_test_capture():
         })
         
     except Exception as e:
-        logger.error(f"Error in test capture: {e}", exc_info=True)
+        logger.error("Error in test capture: %s", e, exc_info=True)
         return jsonify({
             'success': False,
             'error': str(e)
         }), 500
 
 @app.route('/debug/test_capture_pipeline')
+@serialized_capture
 def debug_test_capture_pipeline():
     """
     Debug route to test the entire capture pipeline.
@@ -708,12 +899,13 @@ def debug_test_capture_pipeline():
     try:
         # Step 1: Check capture directory
         capture_dir = app.config['CAPTURE_FOLDER']
+        dir_stat = stat_or_none(capture_dir)
         capture_dir_info = {
             'path': capture_dir,
-            'exists': os.path.exists(capture_dir),
-            'is_dir': os.path.isdir(capture_dir) if os.path.exists(capture_dir) else False,
-            'permissions': oct(os.stat(capture_dir).st_mode)[-3:] if os.path.exists(capture_dir) else None,
-            'writable': os.access(capture_dir, os.W_OK) if os.path.exists(capture_dir) else False
+            'exists': dir_stat is not None,
+            'is_dir': dir_stat is not None and stat.S_ISDIR(dir_stat.st_mode),
+            'permissions': oct(dir_stat.st_mode)[-3:] if dir_stat else None,
+            'writable': os.access(capture_dir, os.W_OK) if dir_stat else False
         }
         
         # Step 2: Test image capture from a single camera
@@ -723,20 +915,21 @@ def debug_test_capture_pipeline():
         # Step 3: Test saving image to disk
         test_filename = f'test_pipeline_{int(time.time())}.jpg'
         test_filepath = os.path.join(capture_dir, test_filename)
-        logger.info(f"Test pipeline: saving image to {test_filepath}")
+        logger.info("Test pipeline: saving image to %s", test_filepath)
         
         if img.mode == 'RGBA':
             img = img.convert('RGB')
             
-        img.save(test_filepath)
+        save_jpeg(img, test_filepath)
         
         # Step 4: Check that the file was saved successfully
+        file_stat = stat_or_none(test_filepath)
         file_info = {
             'filename': test_filename,
             'path': test_filepath,
-            'exists': os.path.exists(test_filepath),
-            'size': os.path.getsize(test_filepath) if os.path.exists(test_filepath) else 0,
-            'permissions': oct(os.stat(test_filepath).st_mode)[-3:] if os.path.exists(test_filepath) else None
+            'exists': file_stat is not None,
+            'size': file_stat.st_size if file_stat else 0,
+            'permissions': oct(file_stat.st_mode)[-3:] if file_stat else None
         }
         
         # Step 5: Test creating a grid image
@@ -760,16 +953,17 @@ def debug_test_capture_pipeline():
         
         grid_filename = f'test_pipeline_grid_{int(time.time())}.jpg'
         grid_filepath = os.path.join(capture_dir, grid_filename)
-        logger.info(f"Test pipeline: saving grid image to {grid_filepath}")
+        logger.info("Test pipeline: saving grid image to %s", grid_filepath)
         
-        grid_img.save(grid_filepath)
+        save_jpeg(grid_img, grid_filepath)
         
+        grid_stat = stat_or_none(grid_filepath)
         grid_file_info = {
             'filename': grid_filename,
             'path': grid_filepath,
-            'exists': os.path.exists(grid_filepath),
-            'size': os.path.getsize(grid_filepath) if os.path.exists(grid_filepath) else 0,
-            'permissions': oct(os.stat(grid_filepath).st_mode)[-3:] if os.path.exists(grid_filepath) else None
+            'exists': grid_stat is not None,
+            'size': grid_stat.st_size if grid_stat else 0,
+            'permissions': oct(grid_stat.st_mode)[-3:] if grid_stat else None
         }
         
         return jsonify({
@@ -780,7 +974,7 @@ def debug_test_capture_pipeline():
         })
         
     except Exception as e:
-        logger.error(f"Error in test capture pipeline: {e}", exc_info=True)
+        logger.error("Error in test capture pipeline: %s", e, exc_info=True)
         return jsonify({
             'success': False,
             'error': str(e),
@@ -801,4 +995,4 @@ def debug_index():
     return render_template('debug_index.html', camera_count=CONFIG["CAMERA_COUNT"])
 
 if __name__ == '__main__':
-    app.run(host='0.0.0.0', port=8000)
+    app.run(host='0.0.0.0', port=8000, threaded=True)
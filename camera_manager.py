@@ -1,18 +1,20 @@
+import io
+import os
 import time
 import logging
 import threading
+import queue
 import gc  # for garbage collection
-import smbus2
-from picamera2 import Picamera2
-from libcamera import controls
-from PIL import Image, ImageDraw, ImageOps
-from unittest.mock import MagicMock  # For test mode
+from collections import deque
+from contextlib import contextmanager
+from types import SimpleNamespace
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from PIL import Image, ImageDraw
+from bootstrap import setup_logging
 
 # Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
+setup_logging()
 logger = logging.getLogger('camera_manager')
 
 # Basic configuration values
@@ -20,14 +22,32 @@ CONFIG = {
     "I2C_BUS": 11,
     "MUX_ADDR": 0x24,
     "CAMERA_COUNT": 4,
-    "SWITCH_DELAY": 0.5,  # Delay after switching cameras (seconds)
+    "SWITCH_DELAY": 0.005,  # Upper bound on multiplexer settle time after switching cameras (seconds)
+    "AF_SETTLE_DELAY": 0.5,  # Upper bound on autofocus re-convergence after the first switch (seconds)
     "STABILIZATION_DELAY": 1.0,  # Delay for camera stabilization (seconds)
     "VIDEO_RESOLUTION": (1280, 720),  # 720p for video streaming
+    "LORES_RESOLUTION": (640, 480),  # YUV420 side stream for grayscale frames, if GRAY_STREAM is set
     "STILL_RESOLUTION": (4056, 3040),  # Full resolution for still captures
     "CROP_RESOLUTION": (1775, 1160),  # Center cropped dimensions for grid composition
+    "JPEG_QUALITY": 90,  # Quality for JPEG-encoded stills
     "CYCLE_INTERVAL": 1.0,  # Default seconds between camera cycles
+    "FRAME_SERVER": False,  # Share preview frames between viewers through a FrameServer ring
+    "POST_PROCESS_TIMEOUT": 10.0,  # Longest wait for the post-processing worker per frame (seconds)
+    "BAD_CAMERAS": (3,),  # Camera indices to skip (camera 4 is broken); they get a placeholder image
+    "DUAL_STREAM": False,  # Serve preview (lores) and stills (main) from one configuration
+    "GRAY_STREAM": False,  # Add the YUV420 lores stream for capture_gray() to the video configuration
+    "REALTIME_CAPTURE": False,  # Pin capture sequences to a core at SCHED_FIFO (needs CAP_SYS_NICE)
+    "CAPTURE_CPU": 3,  # Core used by capture sequences when REALTIME_CAPTURE is set
+    "CAPTURE_RT_PRIORITY": 20,  # SCHED_FIFO priority used when REALTIME_CAPTURE is set
 }
 
+# Stand-in for libcamera.controls in test mode, with the enum values libcamera uses
+_TEST_CONTROLS = SimpleNamespace(
+    AfModeEnum=SimpleNamespace(Manual=0, Auto=1, Continuous=2),
+    AfTriggerEnum=SimpleNamespace(Start=0, Cancel=1),
+    AfStateEnum=SimpleNamespace(Idle=0, Scanning=1, Focused=2, Failed=3),
+)
+
 
 class CameraManager:
     """
@@ -46,7 +66,23 @@ class CameraManager:
     camera_count : int
         Number of cameras connected (default from CONFIG)
     switch_delay : float
-        Delay in seconds after switching cameras (default from CONFIG)
+        Multiplexer settle time in seconds after switching cameras (default from CONFIG)
+    af_settle : float
+        Longest wait in seconds for autofocus on the first camera of a capture
+        sequence; the wait ends as soon as the lens reports focus (default from CONFIG)
+    stabilization_delay : float
+        Longest wait in seconds for the sensor after switching to the still
+        configuration; overlaps the first camera's autofocus (default from CONFIG)
+    still_size : tuple
+        (width, height) of still captures; smaller sizes save ~w*h*3 bytes of
+        buffer memory per still (default from CONFIG)
+    bad_cameras : iterable of int
+        Indices of cameras that are disconnected or faulty; they are never
+        selected and yield a placeholder image (default from CONFIG)
+    dual_stream : bool
+        If True, run a single configuration with full-resolution "main" and
+        preview "lores" streams, so stills need no mode switch; costs
+        full-sensor readout and buffers all the time (default from CONFIG)
     test_mode : bool
         If True, use mock objects instead of real hardware (default: False)
         
@@ -56,6 +92,11 @@ class CameraManager:
     >>> cm.select_camera(0)  # Select first camera
     >>> image = cm.capture_image()  # Capture image from selected camera
     >>> cm.cleanup()  # Clean up resources when done
+    
+    Or, with cleanup handled automatically:
+    
+    >>> with CameraManager() as cm:
+    ...     image = cm.capture_image(0)
     """
     
     # Camera multiplexer control commands
@@ -68,16 +109,50 @@ class CameraManager:
     }
     
     def __init__(self, i2c_bus=None, mux_addr=None, camera_count=None, 
-                 switch_delay=None, test_mode=False):
+                 switch_delay=None, af_settle=None, stabilization_delay=None, still_size=None,
+                 bad_cameras=None, dual_stream=None, test_mode=False):
         # Use provided values or defaults from CONFIG
         self.i2c_bus = i2c_bus if i2c_bus is not None else CONFIG["I2C_BUS"]
         self.mux_addr = mux_addr if mux_addr is not None else CONFIG["MUX_ADDR"]
         self.camera_count = camera_count if camera_count is not None else CONFIG["CAMERA_COUNT"]
         self.switch_delay = switch_delay if switch_delay is not None else CONFIG["SWITCH_DELAY"]
+        self.af_settle = af_settle if af_settle is not None else CONFIG["AF_SETTLE_DELAY"]
+        self.stabilization_delay = (stabilization_delay if stabilization_delay is not None
+                                    else CONFIG["STABILIZATION_DELAY"])
+        self.still_size = tuple(still_size) if still_size is not None else CONFIG["STILL_RESOLUTION"]
+        self._bad_cameras = frozenset(bad_cameras if bad_cameras is not None else CONFIG["BAD_CAMERAS"])
+        # Cameras actually visited by a capture sequence, in order
+        self._capture_order = tuple(i for i in range(self.camera_count) if i not in self._bad_cameras)
+        self.dual_stream = dual_stream if dual_stream is not None else CONFIG["DUAL_STREAM"]
+        # Stream the live preview is read from
+        self.preview_stream = "lores" if self.dual_stream else "main"
+        # The ISP produces the YUV420 side stream on every preview frame, so it's
+        # only configured when asked for; dual-stream mode already uses "lores"
+        self._gray_lores = CONFIG["GRAY_STREAM"] and not self.dual_stream
         
         self.current_camera = None
+        self._last_mux_command = None  # Last command written to the mux, None if unknown
         self.picam = None
-        self.lock = threading.Lock()
+        self._controls = None  # libcamera controls module, set by initialize_camera
+        self._still_af_mode = None  # AfMode stills are captured in, set by initialize_camera
+        # Separate locks for the two independent resources, so preview captures
+        # can overlap a camera switch from another thread:
+        # - _picam_lock guards camera configure/start/stop/capture
+        # - _i2c_lock guards the mux (bus writes, _last_mux_command, current_camera)
+        # Capture sequences take _picam_lock, then _i2c_lock, and hold both so the
+        # mux can't be moved under them. Both are reentrant so a capture can stop
+        # and restart cycling, which selects a camera, while holding them.
+        self._picam_lock = threading.RLock()
+        self._i2c_lock = threading.RLock()
+        # Set while a still capture holds the camera, so preview readers can back off
+        self._still_capture_active = threading.Event()
+        # Single worker that runs the next mux switch while a frame is handed off
+        self._io_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="mux")
+        # Post-processing worker fed by capture_all_cameras; started on first use.
+        # The bounded queue lets capture run at most two frames ahead.
+        self._post_queue = queue.Queue(maxsize=2)
+        self._result_queue = queue.Queue()
+        self._post_worker = None
         self.is_cycling = False
         self.cycle_thread = None
         self.cycle_interval = CONFIG["CYCLE_INTERVAL"]
@@ -86,14 +161,34 @@ class CameraManager:
         self.video_config = None
         self.still_config = None
         
+        # Reusable full-resolution frame buffer, allocated on first still capture
+        self._still_buf = None
+        # LIFO pool of frame buffers for capture_all_cameras; a buffer returns to
+        # the pool once the post-processing worker has converted it
+        self._frame_pool = deque(maxlen=2)
+        
+        # Rendered on first use by _get_disconnected_image()
+        self._disconnected_placeholder = None
+        
+        # Shared preview frame source, see start_frame_server()
+        self.frame_server = None
+        
         # In test mode, we don't initialize real hardware
         self.test_mode = test_mode
         self.bus = None
+        self._mux_msgs = {}  # Prebuilt I2C write messages, one per mux command
         
         if not test_mode:
+            # Hardware libraries are imported lazily so test runs don't need them
+            import smbus2
             try:
                 self.bus = smbus2.SMBus(self.i2c_bus)
-                logger.info(f"Initialized I2C bus {self.i2c_bus}")
+                logger.info("Initialized I2C bus %s", self.i2c_bus)
+                # Same bytes as write_byte_data(mux_addr, 0x24, command), built once
+                self._mux_msgs = {
+                    index: smbus2.i2c_msg.write(self.mux_addr, [0x24, command])
+                    for index, command in self.CAMERA_COMMANDS.items()
+                }
             except Exception as e:
                 logger.error(f"Failed to initialize I2C bus: {e}", exc_info=True)
                 raise
@@ -121,98 +216,214 @@ class CameraManager:
         try:
             # If we're in test mode or a mock was provided, use it
             if self.test_mode or mock_picam is not None:
+                from unittest.mock import MagicMock
                 self.picam = mock_picam if mock_picam is not None else MagicMock()
+                controls = _TEST_CONTROLS
                 camera_info = [{"Model": "imx519", "Location": 2, "Rotation": 0, "Id": "test_camera", "Num": 0}]
-                logger.info(f"Using mock camera for testing")
+                logger.info("Using mock camera for testing")
             else:
+                # Imported here so test mode never loads the camera stack
+                from picamera2 import Picamera2
+                from libcamera import controls
                 self.picam = Picamera2()
                 camera_info = self.picam.global_camera_info()
-                logger.info(f"Camera info: {camera_info}")
-                logger.info(f"Detected IMX519 sensors")
-            
-            # Create base configurations with appropriate resolutions
-            # Preview at 720p resolution with autofocus enabled and white balance adjustment
-            self.video_config = self.picam.create_video_configuration(
-                main={"size": CONFIG["VIDEO_RESOLUTION"]},
-                controls={
-                    "AfMode": controls.AfModeEnum.Continuous,  # Enable continuous autofocus
-                    "AwbEnable": 0,                          # Disable auto white balance
-                    "ColourGains": (2, 1)                  # Apply calibrated white balance gains
-                }
-            )            
-            # Capture at high resolution with autofocus and white balance adjustment
-            self.still_config = self.picam.create_still_configuration(
-                main={"size": CONFIG["STILL_RESOLUTION"]},
-                controls={
-                    "AfMode": controls.AfModeEnum.Auto,  # Enable one-time autofocus for captures
-                    "AwbEnable": 0,                     # Disable auto white balance
-                    "ColourGains": (2, 1)       # Apply calibrated white balance gains
-                }
-            )
+                logger.info("Camera info: %s", camera_info)
+                logger.info("Detected IMX519 sensors")
+            self._controls = controls
+            
+            # Dual-stream stills share the preview's continuous autofocus; otherwise
+            # the still config focuses once per capture. _wait_for_focus() depends on it.
+            self._still_af_mode = controls.AfModeEnum.Continuous if self.dual_stream else controls.AfModeEnum.Auto
+            
+            if self.dual_stream:
+                # One configuration for everything: full-resolution stills on "main"
+                # and the preview on "lores" (the Pi 5 ISP can output RGB there), so
+                # captures skip stop/configure/start and the autofocus re-lock
+                self.video_config = self.still_config = self.picam.create_still_configuration(
+                    main={"size": self.still_size},
+                    lores={"size": CONFIG["VIDEO_RESOLUTION"], "format": "XBGR8888"},
+                    display="lores",
+                    buffer_count=2,
+                    queue=False,
+                    controls={
+                        "AfMode": self._still_af_mode,  # Continuous autofocus, for preview and stills
+                        "AwbEnable": 0,                          # Disable auto white balance
+                        "ColourGains": (2, 1)                  # Apply calibrated white balance gains
+                    }
+                )
+            else:
+                # Create base configurations with appropriate resolutions
+                # Preview at 720p resolution with autofocus enabled and white balance adjustment
+                # Two unqueued buffers are enough for preview and keep mode switches
+                # from reallocating a deeper buffer queue
+                # With GRAY_STREAM, a small YUV420 "lores" stream rides along for
+                # capture_gray(): its Y plane is usable as-is, with no RGB conversion.
+                streams = {"main": {"size": CONFIG["VIDEO_RESOLUTION"]}}
+                if self._gray_lores:
+                    streams["lores"] = {"size": CONFIG["LORES_RESOLUTION"], "format": "YUV420"}
+                self.video_config = self.picam.create_video_configuration(
+                    **streams,
+                    buffer_count=2,
+                    queue=False,
+                    controls={
+                        "AfMode": controls.AfModeEnum.Continuous,  # Enable continuous autofocus
+                        "AwbEnable": 0,                          # Disable auto white balance
+                        "ColourGains": (2, 1)                  # Apply calibrated white balance gains
+                    }
+                )            
+                # Capture at high resolution with autofocus and white balance adjustment.
+                # A single unqueued buffer keeps peak DMA memory at one full frame
+                # (~37 MB at 4056x3040); the cost is that each capture waits for a
+                # fresh frame instead of taking one already queued.
+                self.still_config = self.picam.create_still_configuration(
+                    main={"size": self.still_size},
+                    buffer_count=1,
+                    queue=False,
+                    controls={
+                        "AfMode": self._still_af_mode,  # Enable one-time autofocus for captures
+                        "AwbEnable": 0,                     # Disable auto white balance
+                        "ColourGains": (2, 1)       # Apply calibrated white balance gains
+                    }
+                )
+            
+
+            # Round the preview stream sizes to the ISP's preferred alignment so rows
+            # carry no stride padding and frames map to contiguous arrays without a
+            # copy. Still configurations are left alone, since aligning would change
+            # the saved resolution (e.g. round 4056 wide down); in dual-stream mode
+            # the one configuration carries the stills, so nothing is aligned.
+            if not self.dual_stream:
+                self.picam.align_configuration(self.video_config)
+                logger.debug("Aligned video size: %s", self.video_config["main"]["size"])
             
             # Start with video configuration and set to four-in-one mode
             self.picam.configure(self.video_config)
             self.picam.start()
             
             # Select all cameras (four-in-one mode) initially
-            self.select_camera('all')
+            # Always write the initial state; the mux may have been reset since
+            self.select_camera('all', force=True)
             logger.info("Camera initialized in four-in-one mode for preview")
             
         except Exception as e:
             logger.error(f"Failed to initialize camera: {e}", exc_info=True)
             raise
     
-    def select_camera(self, camera_index, already_locked=False):
+    def select_camera(self, camera_index, force=False):
         """
         Select a specific camera by switching the multiplexer.
         
+        Only the I2C lock is taken, so this does not wait for a preview capture.
+        
         Parameters:
         -----------
         camera_index : int or str
             Index of the camera (0-3) or 'all' for four-in-one mode
-        already_locked : bool
-            If True, assumes the lock is already acquired
+        force : bool
+            Write the mux command even if it matches the last one written,
+            e.g. when the mux state may have been lost
             
         Returns:
         --------
         bool
             True if successful, False otherwise
         """
-        def _do_select_camera():
-            try:
-                # Check if camera index is valid
-                if camera_index not in self.CAMERA_COMMANDS:
-                    logger.error(f"Invalid camera index: {camera_index}")
-                    return False
-                
-                command = self.CAMERA_COMMANDS[camera_index]
-                
-                # In test mode, we just update the state without accessing hardware
-                if not self.test_mode:
+        with self._i2c_lock:
+            return self._switch_mux(camera_index, force=force)
+    
+    def _switch_mux(self, camera_index, force=False):
+        """
+        Switch the multiplexer to a camera.
+        
+        The caller must hold _i2c_lock, possibly from another thread (the
+        capture sequence holds it while the I/O pool performs its switches).
+        
+        Parameters:
+        -----------
+        camera_index : int or str
+            Index of the camera (0-3) or 'all' for four-in-one mode
+        force : bool
+            Write the mux command even if it matches the last one written
+            
+        Returns:
+        --------
+        bool
+            True if successful, False otherwise
+        """
+        try:
+            # Look up and validate the command with a single dict probe
+            command = self.CAMERA_COMMANDS.get(camera_index)
+            if command is None:
+                logger.error(f"Invalid camera index: {camera_index}")
+                return False
+            
+            # In test mode, we just update the state without accessing hardware
+            if not self.test_mode:
+                if command == self._last_mux_command and not force:
+                    # The mux is already on this channel; skip the write and settle delay
+                    logger.debug("Multiplexer already set for camera %s", camera_index)
+                else:
                     # Write to register 0x24 with the appropriate command
                     try:
-                        self.bus.write_byte_data(self.mux_addr, 0x24, command)
-                        # Add additional delay after switching to prevent system freezes
-                        time.sleep(self.switch_delay)
+                        self.bus.i2c_rdwr(self._mux_msgs[camera_index])
+                        # Wait for the switch to take effect to prevent system freezes
+                        self._wait_for_mux(command)
+                        self._last_mux_command = command
                     except Exception as e:
+                        # The mux state is unknown after a failed write
+                        self._last_mux_command = None
                         logger.error(f"I2C communication error during camera select: {e}", exc_info=True)
                         return False
-                
-                logger.info(f"Selected camera: {camera_index}")
-                self.current_camera = camera_index
-                return True
-                
+            
+            logger.debug("Selected camera: %s", camera_index)
+            self.current_camera = camera_index
+            return True
+            
+        except Exception as e:
+            logger.error(f"Failed to select camera {camera_index}: {e}", exc_info=True)
+            return False
+    
+    def _wait_for_mux(self, command):
+        """
+        Wait until the multiplexer reports the given command, at most switch_delay.
+        
+        The mux register is read back every millisecond, so the wait ends as
+        soon as the switch has taken effect instead of always sleeping the
+        full settle time.
+        
+        Parameters:
+        -----------
+        command : int
+            Command byte that was just written to register 0x24
+        
+        Returns:
+        --------
+        bool
+            True if the readback matched before the deadline
+        """
+        deadline = time.monotonic() + self.switch_delay
+        while True:
+            try:
+                if self.bus.read_byte_data(self.mux_addr, 0x24) == command:
+                    return True
             except Exception as e:
-                logger.error(f"Failed to select camera {camera_index}: {e}", exc_info=True)
+                # Readback unsupported or failing; fall back to the fixed delay
+                logger.debug("Mux readback failed (%s), sleeping out settle time", e)
+                time.sleep(max(0.0, deadline - time.monotonic()))
                 return False
-        
-        # If already_locked is True, we assume the lock is already acquired
-        if already_locked:
-            return _do_select_camera()
-        else:
-            # Otherwise, acquire the lock first
-            with self.lock:
-                return _do_select_camera()
+            if time.monotonic() >= deadline:
+                return False
+            time.sleep(0.001)
+    
+    @property
+    def broken_cameras(self):
+        """frozenset of int: Indices of cameras that are skipped and replaced by a placeholder."""
+        return self._bad_cameras
+    
+    @property
+    def capture_cameras(self):
+        """tuple of int: Indices visited by a capture sequence, in order (broken cameras excluded)."""
+        return self._capture_order
     
     def start_camera_cycle(self, interval=None):
         """
@@ -255,6 +466,26 @@ class CameraManager:
         # This gives a consistent behavior when toggling
         self.select_camera(0)
     
+    def start_frame_server(self):
+        """
+        Start publishing preview frames to any number of readers.
+        
+        Without a frame server every stream viewer calls capture_array() on
+        its own. Not available in test mode.
+        
+        Returns:
+        --------
+        FrameServer or None
+            The running frame server, or None in test mode
+        """
+        if self.test_mode:
+            logger.debug("Test mode: frame server not started")
+            return None
+        if self.frame_server is None:
+            self.frame_server = FrameServer(self)
+        self.frame_server.start()
+        return self.frame_server
+    
     def capture_image(self, camera_index=None):
         """
         Capture a high-resolution image from a specific camera.
@@ -274,7 +505,11 @@ class CameraManager:
         Exception
             If image capture fails
         """
-        with self.lock:
+        if camera_index in self._bad_cameras:
+            logger.debug("Camera %s is marked bad, returning placeholder", camera_index)
+            return self._get_disconnected_image()
+        
+        with self._picam_lock, self._i2c_lock, self._still_capture():
             was_cycling = self.is_cycling
             if was_cycling:
                 self.stop_camera_cycle()
@@ -284,40 +519,28 @@ class CameraManager:
                 gc.collect()
                 
                 if camera_index is not None:
-                    self.select_camera(camera_index, already_locked=True)
+                    self._switch_mux(camera_index)
                 
                 # Handle test mode with a mock image
                 if self.test_mode:
-                    logger.info("Test mode: returning test image")
+                    logger.debug("Test mode: returning test image")
                     test_img = Image.new('RGB', (640, 480), color=(100, 150, 200))
                     self._add_center_cross(test_img)
                     return test_img
                 
-                # Switch to still config for high-res capture (includes autofocus)
-                logger.info(f"Switching to still config for camera {camera_index if camera_index is not None else self.current_camera}")
-                self.picam.stop()
-                self.picam.configure(self.still_config)
-                self.picam.start()
-                
-                # Wait for camera to stabilize and focus
-                time.sleep(CONFIG["STABILIZATION_DELAY"])
-                
                 # Capture to a PIL Image
-                logger.info("Capturing image")
+                logger.debug("Capturing still image from camera %s", camera_index if camera_index is not None else self.current_camera)
                 try:
-                    buffer = self.picam.capture_array()
-                    image = Image.fromarray(buffer)
+                    request = self._capture_still_request()
+                    buffer = self._copy_to_still_buffer(request)
                     
-                    # Explicitly clean up intermediate large buffers
-                    del buffer
-                    gc.collect()  # Force garbage collection after using large buffer
-                    
-                    # Add green cross in the center
-                    self._add_center_cross(image)
+                    # Add green cross in the center, directly in the frame array
+                    self._stamp_center_cross(buffer)
+                    image = Image.fromarray(buffer)
                     
                     # Ensure image is in RGB mode
                     if image.mode == 'RGBA':
-                        logger.info("Converting image from RGBA to RGB")
+                        logger.debug("Converting image from RGBA to RGB")
                         image = image.convert('RGB')
                 except Exception as capture_error:
                     logger.error(f"Error during image capture: {capture_error}", exc_info=True)
@@ -326,12 +549,6 @@ class CameraManager:
                     draw = ImageDraw.Draw(image)
                     draw.text((20, 240), f"Capture error: {str(capture_error)}", fill=(255, 0, 0))
                 
-                # Switch back to video config (includes continuous autofocus)
-                logger.info("Switching back to video config")
-                self.picam.stop()
-                self.picam.configure(self.video_config)
-                self.picam.start()
-                
                 return image
                 
             except Exception as e:
@@ -354,6 +571,222 @@ class CameraManager:
                     self.start_camera_cycle(self.cycle_interval)
                 gc.collect()  # Final garbage collection
     
+    def capture_jpeg_bytes(self, camera_index=None, quality=None):
+        """
+        Capture a high-resolution still and return it JPEG-encoded.
+        
+        The frame is encoded straight from the still buffer with simplejpeg
+        (installed alongside picamera2), skipping the PIL image entirely; PIL
+        is used instead if simplejpeg is missing. The Pi 5 has no hardware
+        JPEG encoder, so this is still a CPU encode, but libjpeg-turbo on the
+        raw buffer avoids Image.fromarray's copy.
+        
+        Parameters:
+        -----------
+        camera_index : int or None
+            Index of the camera to capture from, or None to use current camera
+        quality : int or None
+            JPEG quality (default from CONFIG)
+        
+        Returns:
+        --------
+        bytes
+            JPEG data of the capture, or of an error image if capture fails
+        """
+        quality = quality if quality is not None else CONFIG["JPEG_QUALITY"]
+        if self.test_mode or camera_index in self._bad_cameras:
+            # Test and placeholder images only exist as PIL images
+            return self._encode_jpeg(self.capture_image(camera_index), quality)
+        
+        with self._picam_lock, self._i2c_lock, self._still_capture():
+            was_cycling = self.is_cycling
+            if was_cycling:
+                self.stop_camera_cycle()
+            
+            try:
+                if camera_index is not None:
+                    self._switch_mux(camera_index)
+                
+                logger.debug("Capturing JPEG still from camera %s", camera_index if camera_index is not None else self.current_camera)
+                request = self._capture_still_request()
+                buffer = self._copy_to_still_buffer(request)
+                
+                # Add green cross in the center, directly in the frame array
+                self._stamp_center_cross(buffer)
+                
+                return self._encode_frame_jpeg(buffer, quality)
+            except Exception as e:
+                logger.error(f"Failed to capture JPEG: {e}", exc_info=True)
+                error_img = Image.new('RGB', (640, 480), color='black')
+                draw = ImageDraw.Draw(error_img)
+                draw.text((20, 240), f"Error: {str(e)}", fill=(255, 0, 0))
+                return self._encode_jpeg(error_img, quality)
+            finally:
+                if was_cycling:
+                    self.start_camera_cycle(self.cycle_interval)
+    
+    def capture_jpeg(self, path, camera_index=None, quality=None):
+        """
+        Capture a high-resolution still and write it to a JPEG file.
+        
+        Uses capture_jpeg_bytes, so the frame is encoded from the raw
+        buffer without going through a PIL image.
+        
+        Parameters:
+        -----------
+        path : str
+            File to write
+        camera_index : int or None
+            Index of the camera to capture from, or None to use current camera
+        quality : int or None
+            JPEG quality (default from CONFIG)
+        
+        Returns:
+        --------
+        int
+            Number of bytes written
+        """
+        data = self.capture_jpeg_bytes(camera_index, quality)
+        with open(path, 'wb') as f:
+            f.write(data)
+        return len(data)
+    
+    def _encode_frame_jpeg(self, frame, quality):
+        """
+        Encode a frame array to JPEG bytes.
+        
+        Uses simplejpeg, which encodes straight from the array, when it is
+        installed (it comes with picamera2 but is not a declared dependency);
+        otherwise falls back to PIL.
+        
+        Parameters:
+        -----------
+        frame : numpy.ndarray
+            RGB or four-channel (RGBX) frame
+        quality : int
+            JPEG quality
+        
+        Returns:
+        --------
+        bytes
+            JPEG data
+        """
+        try:
+            import simplejpeg
+        except ImportError:
+            return self._encode_jpeg(Image.fromarray(frame), quality)
+        
+        # Match the channel order Image.fromarray would use
+        colorspace = 'RGB' if frame.shape[2] == 3 else 'RGBX'
+        return simplejpeg.encode_jpeg(frame, quality=quality, colorspace=colorspace)
+    
+    def _encode_jpeg(self, image, quality):
+        """
+        Encode a PIL image to JPEG bytes.
+        
+        Parameters:
+        -----------
+        image : PIL.Image
+            Image to encode
+        quality : int
+            JPEG quality
+        
+        Returns:
+        --------
+        bytes
+            JPEG data
+        """
+        if image.mode == 'RGBA':
+            image = image.convert('RGB')
+        img_io = io.BytesIO()
+        image.save(img_io, format='JPEG', quality=quality)
+        return img_io.getvalue()
+    
+    def capture_gray(self):
+        """
+        Capture a grayscale frame.
+        
+        With GRAY_STREAM set, only the Y (luma) plane of the low-resolution
+        YUV420 stream is read, so no colour conversion is needed. Otherwise
+        the preview frame is converted. The camera must be in video mode.
+        
+        Returns:
+        --------
+        PIL.Image
+            Grayscale ('L' mode) image, at LORES_RESOLUTION with GRAY_STREAM
+            and at the preview size otherwise
+        """
+        width, height = CONFIG["LORES_RESOLUTION"] if self._gray_lores else CONFIG["VIDEO_RESOLUTION"]
+        if self.test_mode:
+            logger.debug("Test mode: returning grayscale test image")
+            return Image.new('L', (width, height), color=128)
+        
+        from picamera2 import MappedArray
+        try:
+            with self._picam_lock:
+                request = self.picam.capture_request()
+            try:
+                if self._gray_lores:
+                    with MappedArray(request, "lores") as mapped:
+                        # YUV420 maps as (height * 3 / 2, stride); the first rows are Y
+                        image = Image.fromarray(np.ascontiguousarray(mapped.array[:height, :width]))
+                else:
+                    with MappedArray(request, self.preview_stream) as mapped:
+                        # The four-channel frame wraps without a copy and convert('L')
+                        # ignores the padding byte; slicing off the fourth channel
+                        # first costs a strided copy (~8x slower at 1280x720)
+                        image = Image.fromarray(mapped.array).convert('L')
+            finally:
+                request.release()
+            return image
+        except Exception as e:
+            logger.error(f"Failed to capture grayscale frame: {e}", exc_info=True)
+            error_img = Image.new('L', (width, height), color=0)
+            draw = ImageDraw.Draw(error_img)
+            draw.text((20, height // 2), f"Error: {str(e)}", fill=255)
+            return error_img
+    
+    def capture_preview_image(self, stamp=None):
+        """
+        Capture a preview frame as an RGB PIL Image.
+        
+        The frame is read in place through a MappedArray, so the conversion
+        into the returned image is the only copy; capture_array() would add a
+        full-frame copy before it.
+        
+        Parameters:
+        -----------
+        stamp : callable or None
+            Called with the writable frame array before it is copied out,
+            e.g. to draw crosses into it
+            
+        Returns:
+        --------
+        PIL.Image
+            RGB preview image
+        """
+        if self.test_mode:
+            width, height = CONFIG["LORES_RESOLUTION"]
+            frame = np.full((height, width, 3), (100, 150, 200), dtype=np.uint8)
+            if stamp is not None:
+                stamp(frame)
+            return Image.fromarray(frame)
+        
+        from picamera2 import MappedArray
+        with self._picam_lock:
+            request = self.picam.capture_request()
+        try:
+            with MappedArray(request, self.preview_stream) as mapped:
+                if stamp is not None:
+                    stamp(mapped.array)
+                image = Image.fromarray(mapped.array)
+                # The image must not outlive the mapping. fromarray() already
+                # copies three-channel frames; four-channel ones share the
+                # mapped buffer until the RGB conversion copies them out
+                return image if image.mode == 'RGB' else image.convert('RGB')
+        finally:
+            request.release()
+    
     def capture_all_cameras(self):
         """
         Capture images from all cameras.
@@ -376,80 +809,109 @@ class CameraManager:
             
             # In test mode, create all test images at once
             if self.test_mode:
-                logger.info("Test mode: generating test images for all cameras")
+                logger.debug("Test mode: generating test images for all cameras")
                 for i in range(self.camera_count):
-                    if i == 3:  # Test image for camera 4 
-                        img = Image.new('RGB', (640, 480), color=(150, 100, 200))
-                    else:
-                        img = Image.new('RGB', (640, 480), color=(100, 150, 200))
+                    if i in self._bad_cameras:
+                        images.append(self._get_disconnected_image())
+                        continue
+                    img = Image.new('RGB', (640, 480), color=(100, 150, 200))
                     self._add_center_cross(img)
                     images.append(img)
                 return images
             
-            # Normal hardware mode - use a single lock for the entire operation
-            with self.lock:
-                # First, switch to still config for high-res capture (includes autofocus)
-                logger.info("Switching to still config for all cameras")
-                self.picam.stop()
-                self.picam.configure(self.still_config)
-                self.picam.start()
+            # Normal hardware mode - hold both locks for the entire operation.
+            # Captures are serialized by the multiplexer, but each raw buffer is
+            # handed to the post-processing worker while the mux is already
+            # switching to the next camera on the I/O pool.
+            with self._picam_lock, self._i2c_lock, self._still_capture(), self._realtime_priority():
+                # Dual-stream mode is already running the still configuration
+                reconfigure = self.still_config is not self.video_config
+                if reconfigure:
+                    # Switch to still config once for the whole sequence (includes autofocus)
+                    logger.debug("Switching to still config for all cameras")
+                    self.picam.stop()
+                    self.picam.configure(self.still_config)
+                    self.picam.start()
+                # Sensor stabilization is only needed after a mode switch; either
+                # way this only bounds the wait for the first camera to focus
+                first_settle = max(self.stabilization_delay, self.af_settle) if reconfigure else self.af_settle
                 
-                # Wait for camera to stabilize and focus
-                logger.info(f"Waiting for camera to stabilize ({CONFIG['STABILIZATION_DELAY']}s)")
-                time.sleep(CONFIG["STABILIZATION_DELAY"])
+                self._start_post_worker()
+                submitted = 0
+                high_water = 0  # Deepest post-processing backlog seen this run
+                switch = None
                 
-                for i in range(self.camera_count):
-                    logger.info(f"Capturing from camera {i}")
-                    
-                    # Select camera without using capture_image to avoid nested locks
-                    self.select_camera(i, already_locked=True)
-                    logger.info(f"Camera {i} selected, waiting for stabilization (0.5s)")
-                    time.sleep(self.switch_delay)
-                    
-                    # Capture to a PIL Image
-                    logger.info(f"Capturing image from camera {i}")
-                    try:
-                        # Force garbage collection before capture for memory management
-                        gc.collect()
+                try:
+                    # Select the first camera straight after the mode switch, so sensor
+                    # stabilization and its autofocus run during one shared wait
+                    order = self._capture_order
+                    following = dict(zip(order, order[1:]))
+                    if order:
+                        switch = self._io_pool.submit(self._switch_mux, order[0])
+                    for i in range(self.camera_count):
+                        if i in self._bad_cameras:
+                            # Never select a bad camera; the worker emits a placeholder
+                            self._post_queue.put((i, None, None), timeout=CONFIG["POST_PROCESS_TIMEOUT"])
+                            submitted += 1
+                            high_water = max(high_water, self._post_queue.qsize())
+                            continue
+                        logger.debug("Capturing from camera %s", i)
                         
-                        # Capture the image
-                        logger.info(f"Calling capture_array() for camera {i}")
-                        buffer = self.picam.capture_array()
-                        logger.info(f"Successfully captured array from camera {i} with shape: {buffer.shape}")
+                        # Only the first camera waits for stabilization and autofocus;
+                        # the sensor mode is unchanged for the remaining cameras
+                        settle = first_settle if i == order[0] else 0
                         
-                        # Convert to PIL Image
-                        image = Image.fromarray(buffer)
-                        logger.info(f"Successfully converted array to image for camera {i} with size: {image.size}")
+                        buffer, error = None, None
+                        try:
+                            # Force garbage collection before capture for memory management
+                            gc.collect()
+                            
+                            # Capture the raw frame; conversion happens on the worker
+                            buffer = self._capture_image_nomode(i, settle, switch=switch)
+                            logger.debug("Successfully captured array from camera %s with shape: %s", i, buffer.shape)
+                        except Exception as e:
+                            logger.error(f"Error capturing from camera {i}: {e}", exc_info=True)
+                            error = e
                         
-                        # Clean up large buffer immediately
+                        # Start switching to the next camera before handing off this frame
+                        if i in following:
+                            switch = self._io_pool.submit(self._switch_mux, following[i])
+                        # Blocking put: waits only if the worker is two frames behind
+                        self._post_queue.put((i, buffer, error), timeout=CONFIG["POST_PROCESS_TIMEOUT"])
+                        submitted += 1
+                        high_water = max(high_water, self._post_queue.qsize())
                         del buffer
-                        gc.collect()
-                    except Exception as e:
-                        logger.error(f"Error capturing from camera {i}: {e}", exc_info=True)
-                        # Create a fallback image with error message
-                        image = Image.new('RGB', (640, 480), color='black')
-                        draw = ImageDraw.Draw(image)
-                        draw.text((20, 240), f"Error: {str(e)}", fill=(255, 0, 0))
-                        logger.warning(f"Created fallback error image for camera {i}")
-                    
-                    # Add green cross in the center
-                    self._add_center_cross(image)
+                finally:
+                    # Collect every submitted frame, in camera order, so no stale
+                    # results are left for the next call
+                    for collected in range(submitted):
+                        try:
+                            images.append(self._result_queue.get(timeout=CONFIG["POST_PROCESS_TIMEOUT"]))
+                        except queue.Empty:
+                            # Don't hold both locks forever on a stalled worker
+                            missing = submitted - collected
+                            logger.error("Post-processing worker stalled, %s of %s frames missing",
+                                         missing, submitted)
+                            images.extend(self._get_error_image("Error: post-processing timed out")
+                                          for _ in range(missing))
+                            self._abandon_post_worker()
+                            break
+                    # A mark at maxsize means capture was waiting on post-processing
+                    logger.debug("Post-processing queue high-water mark: %s/%s",
+                                 high_water, self._post_queue.maxsize)
                     
-                    # Ensure image is in RGB mode
-                    if image.mode == 'RGBA':
-                        logger.info(f"Converting image from camera {i} from RGBA to RGB")
-                        image = image.convert('RGB')
+                    # Never reconfigure while a mux write is still in flight
+                    if switch is not None:
+                        switch.result()
                     
-                    images.append(image)
-                    logger.info(f"Successfully added image from camera {i} to images list")
-                
-                # Switch back to video config (includes continuous autofocus)
-                logger.info("Switching back to video config")
-                self.picam.stop()
-                self.picam.configure(self.video_config)
-                self.picam.start()
+                    if reconfigure:
+                        # Switch back to video config once (includes continuous autofocus)
+                        logger.debug("Switching back to video config")
+                        self.picam.stop()
+                        self.picam.configure(self.video_config)
+                        self.picam.start()
             
-            logger.info(f"Successfully captured {len(images)} images")
+            logger.info("Successfully captured %s images", len(images))
             return images
         except Exception as e:
             logger.error(f"Unexpected error in capture_all_cameras: {e}", exc_info=True)
@@ -471,6 +933,392 @@ class CameraManager:
             # Final garbage collection to free memory
             gc.collect()
     
+    def _capture_still_request(self):
+        """
+        Capture a request whose "main" stream holds a full-resolution still.
+        
+        Returns:
+        --------
+        picamera2.CompletedRequest
+            The request; the caller must release it
+        """
+        if self.dual_stream:
+            # The running configuration already delivers stills on "main"
+            return self.picam.capture_request()
+        # Switch to the still config, grab a frame and restore the video config
+        # in one call, instead of two separate stop/configure/start cycles
+        return self.picam.switch_mode_and_capture_request(self.still_config)
+    
+    @property
+    def capturing(self):
+        """True while a still capture holds the camera."""
+        return self._still_capture_active.is_set()
+    
+    @contextmanager
+    def _still_capture(self):
+        """Flag a still capture for the duration of the block (see capturing)."""
+        self._still_capture_active.set()
+        try:
+            yield
+        finally:
+            self._still_capture_active.clear()
+    
+    @contextmanager
+    def _realtime_priority(self):
+        """
+        Pin the calling thread to CAPTURE_CPU at SCHED_FIFO for the block.
+        
+        Keeps Flask and system tasks from preempting the capture sequence's
+        I2C waits. Does nothing unless REALTIME_CAPTURE is set; if the
+        process lacks the privileges the block still runs, unpinned.
+        """
+        if not CONFIG["REALTIME_CAPTURE"] or self.test_mode:
+            yield
+            return
+        
+        saved_affinity = saved_policy = None
+        try:
+            saved_affinity = os.sched_getaffinity(0)
+            os.sched_setaffinity(0, {CONFIG["CAPTURE_CPU"]})
+        except (AttributeError, OSError) as e:
+            saved_affinity = None
+            logger.warning("Could not pin capture thread to CPU %s: %s", CONFIG["CAPTURE_CPU"], e)
+        try:
+            saved_policy = (os.sched_getscheduler(0), os.sched_getparam(0))
+            os.sched_setscheduler(0, os.SCHED_FIFO, os.sched_param(CONFIG["CAPTURE_RT_PRIORITY"]))
+        except (AttributeError, OSError) as e:
+            saved_policy = None
+            logger.warning("Could not switch capture thread to SCHED_FIFO: %s", e)
+        
+        try:
+            yield
+        finally:
+            # Restore the thread's previous scheduling so Flask work isn't pinned
+            try:
+                if saved_policy is not None:
+                    os.sched_setscheduler(0, *saved_policy)
+                if saved_affinity is not None:
+                    os.sched_setaffinity(0, saved_affinity)
+            except OSError as e:
+                logger.error("Error restoring capture thread scheduling: %s", e, exc_info=True)
+    
+    def _copy_to_still_buffer(self, request):
+        """
+        Copy the main stream of a completed request into the reusable still buffer.
+        
+        Reading through a MappedArray avoids allocating a new ~37 MB array for
+        every still. The request is always released, even if the copy fails.
+        
+        Parameters:
+        -----------
+        request : picamera2.CompletedRequest
+            Request returned by the camera
+        
+        Returns:
+        --------
+        numpy.ndarray
+            The still buffer, valid until the next call
+        """
+        from picamera2 import MappedArray
+        try:
+            with MappedArray(request, "main") as mapped:
+                frame = mapped.array
+                if self._still_buf is None or self._still_buf.shape != frame.shape:
+                    self._still_buf = np.empty(frame.shape, dtype=np.uint8)
+                np.copyto(self._still_buf, frame)
+        finally:
+            request.release()
+        return self._still_buf
+    
+    def _wait_for_focus(self, timeout):
+        """
+        Wait until the lens reports focus, triggering a scan if needed.
+        
+        Polls the AfState of each frame's metadata instead of sleeping a
+        fixed worst-case time; IMX519 autofocus usually converges well
+        before the timeout. In AfMode Auto a scan is triggered and only a
+        Focused state seen after it counts; in Continuous mode (dual-stream)
+        the trigger is ignored, so the first Focused state is accepted.
+        
+        Parameters:
+        -----------
+        timeout : float
+            Longest time to wait in seconds
+            
+        Returns:
+        --------
+        bool
+            True if focus was reached, False on failure or timeout
+        """
+        controls = self._controls
+        continuous = self._still_af_mode == controls.AfModeEnum.Continuous
+        deadline = time.monotonic() + timeout
+        try:
+            if not continuous:
+                # AfMode Auto only scans when triggered
+                self.picam.set_controls({"AfTrigger": controls.AfTriggerEnum.Start})
+            # The trigger takes a few frames to apply, so a Focused state left
+            # over from before it only counts once a scan has been seen.
+            # Continuous autofocus keeps tracking on its own, so any Focused counts.
+            scanned = continuous
+            while time.monotonic() < deadline:
+                # capture_metadata() blocks until the next frame, pacing the loop
+                state = self.picam.capture_metadata().get("AfState")
+                if state == controls.AfStateEnum.Scanning:
+                    scanned = True
+                elif scanned and state == controls.AfStateEnum.Focused:
+                    logger.debug("Autofocus converged after %.3fs", timeout - (deadline - time.monotonic()))
+                    return True
+                elif scanned and state == controls.AfStateEnum.Failed and not continuous:
+                    # Continuous mode rescans by itself after a failure, so keep polling
+                    logger.warning("Autofocus scan failed")
+                    return False
+            logger.warning(f"Autofocus did not converge within {timeout}s")
+        except Exception as e:
+            logger.error(f"Error waiting for autofocus: {e}", exc_info=True)
+            time.sleep(max(0.0, deadline - time.monotonic()))
+        return False
+    
+    def _capture_image_nomode(self, camera_index, settle=0, switch=None):
+        """
+        Capture a raw frame from a camera while still mode is already active.
+        
+        Unlike capture_image, this does not switch configurations, so a
+        sequence of captures pays for the mode switch only once. The caller
+        must hold both locks and have configured the still config.
+        
+        Parameters:
+        -----------
+        camera_index : int
+            Index of the camera to capture from
+        settle : float
+            Longest wait in seconds for autofocus after switching; 0 skips it
+        switch : concurrent.futures.Future or None
+            Pending _switch_mux() call for this camera submitted to the
+            I/O pool; waited on instead of selecting here
+        
+        Returns:
+        --------
+        numpy.ndarray
+            The raw captured frame, in a pooled buffer; hand it back with
+            _release_frame_buffer() once it has been converted
+        """
+        from picamera2 import MappedArray
+        
+        # The caller holds the I2C lock, so switch the mux directly
+        # (_switch_mux already waits for the mux to settle)
+        if switch is not None:
+            switch.result()
+        else:
+            self._switch_mux(camera_index)
+        if settle:
+            logger.debug("Camera %s selected, waiting up to %ss for autofocus", camera_index, settle)
+            self._wait_for_focus(settle)
+        
+        logger.debug("Capturing request for camera %s", camera_index)
+        request = self.picam.capture_request()
+        try:
+            # Copy into a pooled buffer instead of letting capture_array()
+            # allocate (and page-fault) a new full-resolution array every time
+            with MappedArray(request, "main") as mapped:
+                buffer = self._acquire_frame_buffer(mapped.array.shape)
+                np.copyto(buffer, mapped.array)
+        finally:
+            request.release()
+        return buffer
+    
+    def _acquire_frame_buffer(self, shape):
+        """
+        Take a buffer of the given shape from the frame pool, or allocate one.
+        
+        Parameters:
+        -----------
+        shape : tuple
+            Required array shape
+        
+        Returns:
+        --------
+        numpy.ndarray
+            Uninitialized uint8 buffer
+        """
+        while self._frame_pool:
+            try:
+                buffer = self._frame_pool.pop()
+            except IndexError:
+                break
+            if buffer.shape == shape:
+                return buffer
+            # Stale size from an earlier configuration; let it be freed
+        return np.empty(shape, dtype=np.uint8)
+    
+    def _release_frame_buffer(self, buffer):
+        """Return a buffer to the frame pool (dropped if the pool is full)."""
+        self._frame_pool.append(buffer)
+    
+    def _start_post_worker(self):
+        """Start the post-processing worker thread if it is not running."""
+        if self._post_worker is None or not self._post_worker.is_alive():
+            self._post_worker = threading.Thread(target=self._post_process_loop,
+                                                 args=(self._post_queue, self._result_queue),
+                                                 name="post-worker", daemon=True)
+            self._post_worker.start()
+    
+    def _stop_post_worker(self):
+        """Stop the post-processing worker thread if it is running."""
+        if self._post_worker is not None and self._post_worker.is_alive():
+            # Bounded waits: a stalled worker with a full queue must not hang cleanup()
+            timeout = CONFIG["POST_PROCESS_TIMEOUT"]
+            try:
+                self._post_queue.put(None, timeout=timeout)
+                self._post_worker.join(timeout)
+            except queue.Full:
+                pass
+            if self._post_worker.is_alive():
+                logger.warning("Post-processing worker did not stop within %ss; abandoning it", timeout)
+                self._abandon_post_worker()
+        self._post_worker = None
+    
+    def _abandon_post_worker(self):
+        """
+        Detach a stalled post-processing worker.
+        
+        The worker is asked to stop once it gets through its backlog, and the
+        next run gets fresh queues, so a late result can't be mistaken for
+        one of its frames.
+        
+        Returns:
+        --------
+        None
+        """
+        try:
+            self._post_queue.put_nowait(None)
+        except queue.Full:
+            pass  # Still stuck on its backlog; it's a daemon thread, so it can't block exit
+        self._post_queue = queue.Queue(maxsize=2)
+        self._result_queue = queue.Queue()
+        self._post_worker = None
+    
+    def _post_process_loop(self, jobs, results):
+        """
+        Worker loop converting queued capture buffers until a None sentinel.
+        
+        Takes (camera_index, buffer, error) tuples from jobs and puts the
+        processed images on results in the same order. Every job produces a
+        result, a fallback image if processing fails, so a waiting capture
+        sequence is never left without one.
+        
+        Parameters:
+        -----------
+        jobs : queue.Queue
+            Queue this worker reads from (the _post_queue it was started with)
+        results : queue.Queue
+            Queue this worker writes to (the matching _result_queue)
+        
+        Returns:
+        --------
+        None
+        """
+        while True:
+            item = jobs.get()
+            if item is None:
+                return
+            camera_index, buffer, error = item
+            try:
+                image = self._process_frame(camera_index, buffer, error)
+            except Exception as e:
+                # E.g. a MemoryError in convert(); a dead worker would deadlock capture
+                logger.error("Post-processing failed for camera %s: %s", camera_index, e, exc_info=True)
+                image = self._get_error_image(f"Error: {e}")
+            results.put(image)
+            
+            # The image no longer references the buffer (fromarray/convert copied it)
+            if buffer is not None:
+                self._release_frame_buffer(buffer)
+            del item, buffer
+    
+    def _process_frame(self, camera_index, buffer, error=None):
+        """
+        Convert a raw capture buffer into an RGB image with a center cross.
+        
+        Parameters:
+        -----------
+        camera_index : int
+            Index of the camera the buffer was captured from
+        buffer : numpy.ndarray or None
+            Raw frame from capture_array(), or None if the capture failed
+        error : Exception or None
+            Capture error to show in the fallback image when buffer is None
+        
+        Returns:
+        --------
+        PIL.Image
+            The processed image, or a fallback error image
+        """
+        if buffer is None and error is None and camera_index in self._bad_cameras:
+            return self._get_disconnected_image()
+        
+        try:
+            if buffer is None:
+                raise error if error is not None else ValueError("No frame captured")
+            
+            # Add green cross in the center, directly in the frame array
+            self._stamp_center_cross(buffer)
+            
+            # Convert to PIL Image
+            image = Image.fromarray(buffer)
+            logger.debug("Successfully converted array to image for camera %s with size: %s", camera_index, image.size)
+        except Exception as e:
+            # Create a fallback image with error message
+            image = self._get_error_image(f"Error: {str(e)}")
+            logger.warning(f"Created fallback error image for camera {camera_index}")
+        
+        # Ensure image is in RGB mode
+        if image.mode == 'RGBA':
+            logger.debug("Converting image from camera %s from RGBA to RGB", camera_index)
+            image = image.convert('RGB')
+        
+        return image
+    
+    def _get_error_image(self, message):
+        """
+        Render a fallback image showing an error message.
+        
+        Parameters:
+        -----------
+        message : str
+            Text drawn on the image
+        
+        Returns:
+        --------
+        PIL.Image
+            Black 640x480 image with the message and center cross
+        """
+        image = Image.new('RGB', (640, 480), color='black')
+        draw = ImageDraw.Draw(image)
+        draw.text((20, 240), message, fill=(255, 0, 0))
+        self._add_center_cross(image, draw=draw)
+        return image
+    
+    def _get_disconnected_image(self):
+        """
+        Get the placeholder shown for a bad or disconnected camera.
+        
+        The placeholder never changes, so it is rendered once and copied.
+        
+        Returns:
+        --------
+        PIL.Image
+            Black 640x480 image with a message and center cross; a fresh copy
+            the caller may modify
+        """
+        if self._disconnected_placeholder is None:
+            image = Image.new('RGB', (640, 480), color='black')
+            draw = ImageDraw.Draw(image)
+            draw.text((20, 240), "Camera disconnected", fill=(255, 0, 0))
+            self._add_center_cross(image, draw=draw)
+            self._disconnected_placeholder = image
+        return self._disconnected_placeholder.copy()
+    
     def create_grid_image(self, images):
         """
         Create a 2x2 grid image from four input images.
@@ -495,7 +1343,7 @@ class CameraManager:
         if len(images) != 4:
             raise ValueError(f"Expected 4 images, got {len(images)}")
         
-        logger.info(f"Creating grid image from {len(images)} images")
+        logger.debug("Creating grid image from %s images", len(images))
         
         try:
             # Force garbage collection before grid creation
@@ -504,64 +1352,61 @@ class CameraManager:
             # Make sure all images are in RGB mode and same size
             rgb_images = []
             for i, img in enumerate(images):
-                logger.info(f"Processing image {i} with mode {img.mode} and size {img.size}")
+                logger.debug("Processing image %s with mode %s and size %s", i, img.mode, img.size)
                 
-                # Convert to RGB if needed
-                if img.mode == 'RGBA':
-                    logger.info(f"Converting image {i} from RGBA to RGB")
-                    img = img.convert('RGB')
-                elif img.mode != 'RGB':
-                    logger.info(f"Converting image {i} from {img.mode} to RGB")
+                # Convert to RGB if needed (RGBA included)
+                if img.mode != 'RGB':
+                    logger.debug("Converting image %s from %s to RGB", i, img.mode)
                     img = img.convert('RGB')
                 
                 rgb_images.append(img)
             
-            # Get the most common size (in case images have different sizes)
-            sizes = [img.size for img in rgb_images]
-            logger.info(f"Image sizes: {sizes}")
+            # Only build the size list when it will actually be logged
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug("Image sizes: %s", [img.size for img in rgb_images])
             
             # Use the first image's size as reference
             width, height = rgb_images[0].size
-            logger.info(f"Using dimensions for grid: {width}x{height}")
+            logger.debug("Using dimensions for grid: %sx%s", width, height)
             
             # Create a new image with 2x2 grid layout
             grid_width, grid_height = width * 2, height * 2
-            logger.info(f"Creating new grid image with dimensions {grid_width}x{grid_height}")
+            logger.debug("Creating new grid image with dimensions %sx%s", grid_width, grid_height)
             grid_image = Image.new('RGB', (grid_width, grid_height))
             
             # Paste images into grid, resizing if needed
-            logger.info("Pasting images into grid")
+            logger.debug("Pasting images into grid")
             
             # Top-left image (camera 0)
             if rgb_images[0].size != (width, height):
-                logger.info(f"Resizing image 0 from {rgb_images[0].size} to {width}x{height}")
+                logger.debug("Resizing image 0 from %s to %sx%s", rgb_images[0].size, width, height)
                 rgb_images[0] = rgb_images[0].resize((width, height))
             grid_image.paste(rgb_images[0], (0, 0))
             
             # Top-right image (camera 1)
             if rgb_images[1].size != (width, height):
-                logger.info(f"Resizing image 1 from {rgb_images[1].size} to {width}x{height}")
+                logger.debug("Resizing image 1 from %s to %sx%s", rgb_images[1].size, width, height)
                 rgb_images[1] = rgb_images[1].resize((width, height))
             grid_image.paste(rgb_images[1], (width, 0))
             
             # Bottom-left image (camera 2)
             if rgb_images[2].size != (width, height):
-                logger.info(f"Resizing image 2 from {rgb_images[2].size} to {width}x{height}")
+                logger.debug("Resizing image 2 from %s to %sx%s", rgb_images[2].size, width, height)
                 rgb_images[2] = rgb_images[2].resize((width, height))
             grid_image.paste(rgb_images[2], (0, height))
             
             # Bottom-right image (camera 3)
             if rgb_images[3].size != (width, height):
-                logger.info(f"Resizing image 3 from {rgb_images[3].size} to {width}x{height}")
+                logger.debug("Resizing image 3 from %s to %sx%s", rgb_images[3].size, width, height)
                 rgb_images[3] = rgb_images[3].resize((width, height))
             grid_image.paste(rgb_images[3], (width, height))
             
-            logger.info("All images pasted into grid successfully")
+            logger.debug("All images pasted into grid successfully")
             
             # Force garbage collection after grid creation
             gc.collect()
             
-            logger.info(f"Grid image created successfully with size {grid_image.size}")
+            logger.debug("Grid image created successfully with size %s", grid_image.size)
             return grid_image
             
         except Exception as e:
@@ -572,23 +1417,33 @@ class CameraManager:
             draw.text((640, 480), f"Grid creation error: {str(e)}", fill=(255, 0, 0))
             return fallback_img
     
-    def _draw_cross_at(self, image, x, y, size=None):
+    def _draw_cross_at(self, image, x, y, size=None, draw=None):
         """
         Draw a green cross at the specified location.
         
         Parameters:
         -----------
-        image : PIL.Image
-            Image to draw on
+        image : PIL.Image or numpy.ndarray
+            Image to draw on; arrays are stamped in place with _stamp_cross
         x : int
             X coordinate for center of cross
         y : int
             Y coordinate for center of cross
         size : int or None
             Size of cross arms (proportional to image if None)
+        draw : PIL.ImageDraw.ImageDraw or None
+            Existing drawing context for image, reused to avoid creating
+            a new one for every cross
         """
+        if isinstance(image, np.ndarray):
+            if size is None:
+                size = min(image.shape[:2]) // 30
+            self._stamp_cross(image, x, y, size)
+            return
+        
         try:
-            draw = ImageDraw.Draw(image)
+            if draw is None:
+                draw = ImageDraw.Draw(image)
             if size is None:
                 # Make cross size proportional to image, but smaller than the default cross
                 size = min(image.width, image.height) // 30
@@ -610,25 +1465,69 @@ class CameraManager:
             logger.error(f"Error drawing cross: {e}", exc_info=True)
             # Continue without drawing cross - non-critical feature
     
-    def _add_center_cross(self, image):
+    def _add_center_cross(self, image, draw=None):
         """
         Add a green cross in the center of the image.
         
         Parameters:
         -----------
-        image : PIL.Image
-            Image to add the cross to
+        image : PIL.Image or numpy.ndarray
+            Image to add the cross to; arrays are stamped in place
+        draw : PIL.ImageDraw.ImageDraw or None
+            Existing drawing context for image (created if None)
         """
+        if isinstance(image, np.ndarray):
+            self._stamp_center_cross(image)
+            return
+        
         try:
             width, height = image.size
             center_x, center_y = width // 2, height // 2
             size = min(width, height) // 20  # Cross size proportional to image
             
-            self._draw_cross_at(image, center_x, center_y, size)
+            self._draw_cross_at(image, center_x, center_y, size, draw=draw)
         except Exception as e:
             logger.error(f"Error adding center cross: {e}", exc_info=True)
             # Continue without adding cross - non-critical feature
             
+    def _stamp_cross(self, frame, x, y, size):
+        """
+        Write a green cross directly into a frame array.
+        
+        This is the array counterpart of _draw_cross_at: two slice assignments
+        instead of building a drawing context for a full-resolution image.
+        
+        Parameters:
+        -----------
+        frame : numpy.ndarray
+            Writable (height, width, channels) uint8 array, modified in place
+        x : int
+            X coordinate for center of cross
+        y : int
+            Y coordinate for center of cross
+        size : int
+            Size of cross arms
+        """
+        try:
+            height, width = frame.shape[:2]
+            frame[y, max(x - size, 0):min(x + size + 1, width), :3] = (0, 255, 0)
+            frame[max(y - size, 0):min(y + size + 1, height), x, :3] = (0, 255, 0)
+        except Exception as e:
+            logger.error(f"Error stamping cross: {e}", exc_info=True)
+            # Continue without drawing cross - non-critical feature
+    
+    def _stamp_center_cross(self, frame):
+        """
+        Write a green cross in the center of a frame array.
+        
+        Parameters:
+        -----------
+        frame : numpy.ndarray
+            Writable (height, width, channels) uint8 array, modified in place
+        """
+        height, width = frame.shape[:2]
+        self._stamp_cross(frame, width // 2, height // 2, min(width, height) // 20)
+    
     def center_crop_image(self, image, target_width=None, target_height=None):
         """
         Center crop an image to the specified dimensions.
@@ -659,7 +1558,7 @@ class CameraManager:
                 
             # Get current dimensions
             orig_width, orig_height = image.size
-            logger.info(f"Center cropping image from {orig_width}x{orig_height} to {target_width}x{target_height}")
+            logger.debug("Center cropping image from %sx%s to %sx%s", orig_width, orig_height, target_width, target_height)
             
             # If target dimensions are larger than original, return original
             if target_width >= orig_width or target_height >= orig_height:
@@ -674,7 +1573,7 @@ class CameraManager:
             
             # Crop the image
             cropped_image = image.crop((left, top, right, bottom))
-            logger.info(f"Image successfully cropped to {target_width}x{target_height}")
+            logger.debug("Image successfully cropped to %sx%s", target_width, target_height)
             
             return cropped_image
         except Exception as e:
@@ -694,6 +1593,10 @@ class CameraManager:
         None
         """
         try:
+            # Stop the frame server before the camera it reads from
+            if self.frame_server is not None:
+                self.frame_server.stop()
+            
             # Always stop cycling first
             if self.is_cycling:
                 self.stop_camera_cycle()
@@ -714,9 +1617,149 @@ class CameraManager:
                     except Exception as e:
                         logger.warning(f"Error closing bus: {e}", exc_info=True)
                         
+            self._stop_post_worker()
+            self._io_pool.shutdown(wait=True)
+            
             # Force final garbage collection
             gc.collect()
             logger.info("Camera manager cleanup completed")
             
         except Exception as e:
             logger.error(f"Error during cleanup: {e}", exc_info=True)
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, exc_type, exc_value, traceback):
+        # Release the hardware even if the block raised; don't suppress the error
+        self.cleanup()
+        return False
+
+
+class FrameServer:
+    """
+    Background thread sharing the latest preview frame between readers.
+    
+    Each published frame is copied once from the camera request into a ring
+    of preallocated slots, and every reader waiting at that moment gets the
+    same array. Frames are only captured while someone is waiting for one.
+    
+    A returned array stays valid until (slots - 1) newer frames have been
+    published; readers should copy it (e.g. by converting to a PIL image)
+    before doing anything slow. While a still capture holds the camera
+    there are no preview frames, and readers get None without waiting.
+    
+    Parameters:
+    -----------
+    camera_manager : CameraManager
+        Manager owning the camera; its camera lock serializes captures with mode switches
+    slots : int
+        Number of frames in the ring (default: 3)
+    """
+    
+    def __init__(self, camera_manager, slots=3):
+        self.camera_manager = camera_manager
+        self._slots = [None] * slots
+        self._seq = 0  # Number of frames published so far
+        self._latest = None  # Slot index of the newest frame
+        self._cond = threading.Condition()
+        self._wanted = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+    
+    def start(self):
+        """Start the capture thread if it is not already running."""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        # Drop demand left over from stop() or from readers while stopped, so
+        # the loop doesn't grab a frame (and the camera locks) for nobody
+        self._wanted.clear()
+        self._thread = threading.Thread(target=self._run, name="frame-server", daemon=True)
+        self._thread.start()
+        logger.info("Frame server started")
+    
+    def stop(self, timeout=2.0):
+        """Stop the capture thread and wake up any waiting readers."""
+        self._stop.set()
+        self._wanted.set()
+        with self._cond:
+            self._cond.notify_all()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+            logger.info("Frame server stopped")
+    
+    def wait_for_frame(self, timeout=1.0):
+        """
+        Wait for a frame captured after this call.
+        
+        Parameters:
+        -----------
+        timeout : float
+            Maximum seconds to wait
+        
+        Returns:
+        --------
+        numpy.ndarray or None
+            The new frame, or None on timeout, during a still capture, or
+            when the server is stopped
+        """
+        if self.camera_manager.capturing:
+            return None
+        with self._cond:
+            seq = self._seq
+            self._wanted.set()
+            if not self._cond.wait_for(lambda: self._seq > seq or self._stop.is_set(), timeout):
+                return None
+            if self._seq == seq:
+                return None
+            return self._slots[self._latest]
+    
+    def _run(self):
+        """Capture loop: publish one frame per round of reader demand."""
+        while not self._stop.is_set():
+            self._wanted.wait()
+            if self._stop.is_set():
+                break
+            self._wanted.clear()
+            try:
+                # Only this thread writes slots, so the next index is stable
+                index = (self._seq + 1) % len(self._slots)
+                self._capture_into(index)
+                
+                with self._cond:
+                    self._seq += 1
+                    self._latest = index
+                    self._cond.notify_all()
+            except Exception as e:
+                logger.error("Frame server capture failed: %s", e, exc_info=True)
+                self._stop.wait(1.0)
+    
+    def _capture_into(self, index):
+        """
+        Copy one preview frame from the camera into a ring slot.
+        
+        Parameters:
+        -----------
+        index : int
+            Slot to fill; reallocated if the frame size has changed
+        
+        Returns:
+        --------
+        None
+        """
+        from picamera2 import MappedArray
+        cm = self.camera_manager
+        # Hold the camera lock so a capture never races a mode switch
+        with cm._picam_lock:
+            request = cm.picam.capture_request()
+        try:
+            with MappedArray(request, cm.preview_stream) as mapped:
+                frame = mapped.array
+                slot = self._slots[index]
+                if slot is None or slot.shape != frame.shape:
+                    slot = self._slots[index] = np.empty(frame.shape, dtype=frame.dtype)
+                np.copyto(slot, frame)
+        finally:
+            request.release()
@@ -11,16 +11,10 @@ import sys
 import time
 from flask import Flask
 from cam import app, APP_CONFIG
+from bootstrap import setup_logging, ensure_dir
 
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.StreamHandler(sys.stdout),
-        logging.FileHandler('multicam.log')
-    ]
-)
+# Configure logging; importing cam already set up the console handler
+setup_logging(log_file='multicam.log')
 logger = logging.getLogger('multicam_runner')
 
 def main():
@@ -46,29 +40,18 @@ def main():
         
         # Make sure captures directory exists and is properly configured
         captures_dir = os.path.join(os.path.dirname(__file__), 'captures')
-        logger.info(f"Ensuring captures directory exists: {captures_dir}")
+        logger.info("Ensuring captures directory exists: %s", captures_dir)
         
         try:
-            if not os.path.exists(captures_dir):
-                logger.info(f"Creating captures directory: {captures_dir}")
-                os.makedirs(captures_dir, exist_ok=True)
-                os.chmod(captures_dir, APP_CONFIG["DIR_PERMISSIONS"])
-                logger.info(f"Created captures directory: {captures_dir}")
-            else:
-                logger.info(f"Captures directory already exists: {captures_dir}")
-                # Still ensure permissions
-                os.chmod(captures_dir, APP_CONFIG["DIR_PERMISSIONS"])
+            ensure_dir(captures_dir, APP_CONFIG["DIR_PERMISSIONS"])
             
             # List directory contents
-            if os.path.exists(captures_dir):
-                files = os.listdir(captures_dir)
-                logger.info(f"Captures directory contains {len(files)} files")
-                if files:
-                    logger.info(f"Sample files: {files[:5]}{'...' if len(files) > 5 else ''}")
-            else:
-                logger.error(f"Captures directory still does not exist after creation attempt: {captures_dir}")
+            files = os.listdir(captures_dir)
+            logger.info("Captures directory contains %s files", len(files))
+            if files:
+                logger.info("Sample files: %s%s", files[:5], '...' if len(files) > 5 else '')
         except Exception as e:
-            logger.error(f"Error setting up captures directory: {e}", exc_info=True)
+            logger.error("Error setting up captures directory: %s", e, exc_info=True)
             logger.warning("Continuing without guaranteed capture directory - it will be attempted again during runtime")
         
         # Configure Flask app with proper capture directory
@@ -77,22 +60,18 @@ def main():
         # Ensure logs directory exists
         logs_dir = os.path.join(os.path.dirname(__file__), 'logs')
         try:
-            if not os.path.exists(logs_dir):
-                logger.info(f"Creating logs directory: {logs_dir}")
-                os.makedirs(logs_dir, exist_ok=True)
-                os.chmod(logs_dir, APP_CONFIG["DIR_PERMISSIONS"])
-            else:
-                logger.info(f"Logs directory already exists: {logs_dir}")
+            ensure_dir(logs_dir, APP_CONFIG["DIR_PERMISSIONS"])
         except Exception as e:
-            logger.error(f"Error setting up logs directory: {e}", exc_info=True)
+            logger.error("Error setting up logs directory: %s", e, exc_info=True)
             logger.warning("Continuing without logs directory")
         
         # Start the Flask app
         logger.info("Starting web server on 0.0.0.0:8000")
-        app.run(host='0.0.0.0', port=8000, debug=False)
+        # Threaded, so the MJPEG preview keeps streaming while a capture runs
+        app.run(host='0.0.0.0', port=8000, debug=False, threaded=True)
         
     except Exception as e:
-        logger.error(f"Error starting application: {e}", exc_info=True)
+        logger.error("Error starting application: %s", e, exc_info=True)
         sys.exit(1)
 
 if __name__ == "__main__":
@@ -3,12 +3,18 @@ pytest configuration for multicam view tests
 """
 import os
 import pytest
-import shutil
-import tempfile
 import logging
 from unittest.mock import patch, MagicMock
 from PIL import Image
 
+# Solid-colour images shared by the fixtures below, built once per session.
+# Nothing downstream draws on them; fixtures hand out new lists but the same
+# image objects, so tests must copy an image before modifying it.
+_GREY = Image.new('RGB', (640, 480), color=(100, 100, 100))
+_BLUE = Image.new('RGB', (640, 480), color=(100, 150, 200))
+_BLACK = Image.new('RGB', (640, 480), color=(0, 0, 0))
+_GRID = Image.new('RGB', (1280, 960), color=(200, 200, 200))
+
 @pytest.fixture(scope="session", autouse=True)
 def cleanup_logging():
     """Clean up logging handlers to prevent I/O errors."""
@@ -39,37 +45,48 @@ def cleanup_logging():
 import cam
 from camera_manager import CameraManager
 
-@pytest.fixture
-def app():
-    """Create a Flask app test client for testing routes."""
-    # Create a temporary directory for test captures
-    test_dir = tempfile.mkdtemp()
-    
-    # Configure the app with the test directory
+# Attribute names for the mock camera manager's spec, listed once per session;
+# a class spec makes every MagicMock walk the class again
+_CAMERA_MANAGER_SPEC = dir(CameraManager)
+
+@pytest.fixture(scope="session")
+def flask_client():
+    """Create one Flask test client for the whole session."""
     cam.app.config['TESTING'] = True
-    cam.app.config['CAPTURE_FOLDER'] = test_dir
+    # Not entered as a context manager, so no request context outlives a test;
+    # the app sets no cookies, so the client needn't keep a cookie jar
+    return cam.app.test_client(use_cookies=False)
+
+@pytest.fixture(scope="session")
+def captures_dir(tmp_path_factory):
+    """Create one captures folder for the whole session."""
+    return str(tmp_path_factory.mktemp('captures'))
+
+@pytest.fixture
+def app(captures_dir, flask_client):
+    """Provide the Flask test client for testing routes."""
+    # Point the app at the session's captures folder, emptied of whatever the
+    # previous test left there
+    for entry in os.scandir(captures_dir):
+        os.unlink(entry.path)
+    cam.app.config['CAPTURE_FOLDER'] = captures_dir
     
     # Ensure the camera_manager is mocked
     old_cm = cam.camera_manager
     cam.camera_manager = None  # Will be set by mock_camera_manager fixture when needed
     
-    # Return the Flask test client
-    with cam.app.test_client() as client:
-        # Provide the context
-        yield client
-        
+    # Return the shared Flask test client
+    yield flask_client
+    
     # Restore the original camera_manager
     cam.camera_manager = old_cm
-    
-    # Clean up the temp directory after the test
-    shutil.rmtree(test_dir)
 
 @pytest.fixture
 def mock_camera_manager():
     """Create a mock camera manager for testing."""
     with patch('cam.CameraManager') as mock_cm_class:
         # Create a mock instance
-        mock_cm = MagicMock(spec=CameraManager)
+        mock_cm = MagicMock(spec=_CAMERA_MANAGER_SPEC)
         mock_cm_class.return_value = mock_cm
         
         # Mock the current_camera property
@@ -77,37 +94,31 @@ def mock_camera_manager():
         
         # Mock capture_image to return a test image
         def mock_capture_image(camera_idx=None):
-            img = Image.new('RGB', (640, 480), color=(100, 100, 100))
-            return img
+            return _GREY
         
         mock_cm.capture_image.side_effect = mock_capture_image
         
         # Mock capture_all_cameras to return a list of test images
         def mock_capture_all_cameras():
-            images = []
-            for i in range(4):
-                color = (100, 100, 100) if i != 3 else (0, 0, 0)
-                img = Image.new('RGB', (640, 480), color=color)
-                images.append(img)
-            return images
+            return [_GREY, _GREY, _GREY, _BLACK]
         
         mock_cm.capture_all_cameras.side_effect = mock_capture_all_cameras
         
         # Mock create_grid_image to return a test grid
         def mock_create_grid_image(images):
-            grid = Image.new('RGB', (1280, 960), color=(200, 200, 200))
-            return grid
+            return _GRID
         
         mock_cm.create_grid_image.side_effect = mock_create_grid_image
         
         yield mock_cm
 
 @pytest.fixture
+def patched_cm(monkeypatch, mock_camera_manager):
+    """Install the mock camera manager as cam.camera_manager for one test."""
+    monkeypatch.setattr(cam, 'camera_manager', mock_camera_manager)
+    return mock_camera_manager
+
+@pytest.fixture(scope="session")
 def test_images():
-    """Create a set of test images for testing."""
-    images = []
-    for i in range(4):
-        color = (100, 150, 200) if i != 3 else (0, 0, 0)
-        img = Image.new('RGB', (640, 480), color=color)
-        images.append(img)
-    return images
+    """Provide a set of test images for testing (shared; copy before drawing)."""
+    return [_BLUE, _BLUE, _BLUE, _BLACK]
@@ -2,13 +2,40 @@
 Tests for the CameraManager class
 """
 import pytest
+import io
 import os
 import tempfile
-import gc
+import threading
+import time
+import weakref
+import numpy as np
 from unittest.mock import patch, MagicMock
 from PIL import Image
 
-from camera_manager import CameraManager
+from camera_manager import CameraManager, FrameServer
+
+# CameraManager instances created by these tests, so teardown can clean them
+# up without scanning every object on the heap
+_live_cms = weakref.WeakSet()
+# Instances owned by shared fixtures, which clean them up themselves
+_shared_cms = weakref.WeakSet()
+
+# Frame returned by the mocked Picamera2; shared, so tests must not modify it
+_FAKE_FRAME = np.zeros((480, 640, 3), dtype=np.uint8)
+
+# Grey image for the cross-drawing tests; they draw on it, so they take a copy
+_GREY_640 = Image.new('RGB', (640, 480), color=(100, 100, 100))
+
+@pytest.fixture(scope="module", autouse=True)
+def track_camera_managers():
+    """Register every CameraManager created in this module in _live_cms."""
+    original_init = CameraManager.__init__
+    def tracking_init(self, *args, **kwargs):
+        original_init(self, *args, **kwargs)
+        _live_cms.add(self)
+    with pytest.MonkeyPatch.context() as mp:
+        mp.setattr(CameraManager, '__init__', tracking_init)
+        yield
 
 class TestCameraManager:
     """Test suite for CameraManager class."""
@@ -17,13 +44,13 @@ class TestCameraManager:
     def stop_any_camera_cycles(self):
         """Ensure any camera cycles are stopped after each test."""
         yield
-        # After each test, force cleanup of any CameraManager instances that might still be running
-        for obj in list(gc.get_objects()):
-            if isinstance(obj, CameraManager):
-                try:
-                    obj.cleanup()
-                except:
-                    pass
+        # After each test, force cleanup of any CameraManager instances that might still be running,
+        # except those shared fixtures keep alive for later tests
+        for cm in list(_live_cms - _shared_cms):
+            try:
+                cm.cleanup()
+            except:
+                pass
     
     @pytest.fixture
     def mocked_smbus(self):
@@ -36,6 +63,8 @@ class TestCameraManager:
     @pytest.fixture
     def mocked_picamera(self):
         """Create a mocked Picamera2 for testing."""
+        # Patching needs the real module; test-mode managers never import it
+        pytest.importorskip('picamera2')
         with patch('picamera2.Picamera2') as mock_picam_class:
             mock_picam = MagicMock()
             mock_picam_class.return_value = mock_picam
@@ -43,18 +72,24 @@ class TestCameraManager:
             # Mock camera info
             mock_picam.global_camera_info.return_value = [{'Model': 'imx519'}]
             
-            # Mock capture_array to return a numpy array that PIL can convert
-            mock_picam.capture_array.return_value = MagicMock(shape=(480, 640, 3), 
-                                                            __array_interface__={
-                                                                'data': (0, False),
-                                                                'strides': None,
-                                                                'shape': (480, 640, 3),
-                                                                'typestr': '|u1',
-                                                                'version': 3,
-                                                            })
+            # Mock capture_array to return a real frame that PIL can convert
+            mock_picam.capture_array.return_value = _FAKE_FRAME
             
             yield mock_picam
     
+    @pytest.fixture(scope="class")
+    def cm(self):
+        """Create one test-mode CameraManager shared by the class; tests leave it in four-in-one mode."""
+        # Test mode never touches the hardware libraries, so plain mocks are
+        # injected instead of patching them. Camera 3 is marked bad explicitly,
+        # so the broken-camera cases don't rely on CONFIG
+        cm = CameraManager(i2c_bus=1, mux_addr=0x24, camera_count=4, bad_cameras={3}, test_mode=True)
+        cm.initialize_camera(mock_picam=MagicMock())
+        cm.bus = MagicMock()
+        _shared_cms.add(cm)
+        yield cm
+        cm.cleanup()
+    
     def test_initialization(self, mocked_smbus, mocked_picamera):
         """Test that CameraManager initializes correctly."""
         # Use test_mode=True since we can't access actual hardware during tests
@@ -73,133 +108,608 @@ class TestCameraManager:
         # Cleanup
         cm.cleanup()
     
-    def test_select_camera(self, mocked_smbus, mocked_picamera):
+    def test_select_camera(self, cm):
         """Test camera selection."""
-        # Use test_mode=True since we can't access actual hardware during tests
+        # The bus mock is shared, so drop calls made by earlier tests
+        cm.bus.reset_mock()
+        
+        try:
+            # Test selecting camera 0
+            result = cm.select_camera(0)
+            assert result is True
+            assert cm.current_camera == 0
+            
+            # In test mode it shouldn't call the hardware
+            assert not cm.bus.write_byte_data.called
+            
+            # Test broken camera 3
+            cm.bus.reset_mock()
+            result = cm.select_camera(3)
+            assert result is True
+            assert cm.current_camera == 3
+            # Should not have called the bus for camera 3 (broken)
+            assert not cm.bus.write_byte_data.called
+        finally:
+            # Leave the shared manager in four-in-one mode for the other tests
+            cm.select_camera('all')
+    
+    def test_camera_cycle(self, cm):
+        """Test camera cycling."""
+        # Start cycling
+        cm.start_camera_cycle(interval=0.01)  # Fast interval for testing
+        assert cm.is_cycling is True
+        
+        # Four-in-one mode is selected synchronously; there is no cycle thread to wait for
+        assert cm.current_camera == 'all'
+        assert cm.cycle_interval == 0.01
+        
+        # Stop cycling
+        cm.stop_camera_cycle()
+        assert cm.is_cycling is False
+    
+    @pytest.mark.parametrize('method, args, expected_count, black_index', [
+        ('capture_image', (0,), 1, None),
+        ('capture_image', (3,), 1, 0),
+        ('capture_all_cameras', (), 4, 3),
+    ], ids=['camera_0', 'broken_camera_3', 'all_cameras'])
+    @patch('time.sleep')  # Mock sleep to speed up tests
+    def test_capture(self, mock_sleep, cm, method, args, expected_count, black_index):
+        """Test single-camera and all-camera capture."""
+        # In test mode, captures return test images directly
+        result = getattr(cm, method)(*args)
+        images = result if isinstance(result, list) else [result]
+        
+        assert len(images) == expected_count
+        assert all(type(img) is Image.Image for img in images)
+        
+        # Camera 4 (index 3) should be black (broken camera)
+        if black_index is not None:
+            assert images[black_index].getpixel((0, 0))[0] == 0
+    
+    def test_create_grid_image(self, test_images):
+        """Test grid image creation."""
         cm = CameraManager(i2c_bus=1, mux_addr=0x24, camera_count=4, test_mode=True)
         
-        # Initialize with mock picam
-        cm.initialize_camera(mock_picam=mocked_picamera)
+        # Create a grid from test images
+        grid = cm.create_grid_image(test_images)
+        
+        # Check grid dimensions
+        assert isinstance(grid, Image.Image)
+        assert grid.width == test_images[0].width * 2
+        assert grid.height == test_images[0].height * 2
+        
+        # Cleanup
+        cm.cleanup()
+    
+    def test_add_center_cross(self, cm):
+        """Test adding center cross to image."""
+        # Create a test image
+        image = _GREY_640.copy()
         
-        # Patch the bus for testing
-        cm.bus = mocked_smbus
+        # Add a cross to it
+        cm._add_center_cross(image)
         
-        # Test selecting camera 0
-        result = cm.select_camera(0)
-        assert result is True
-        assert cm.current_camera == 0
+        # We can't easily check the pixels, but we can make sure it doesn't crash
+        assert isinstance(image, Image.Image)
+    
+    def test_stamp_center_cross(self):
+        """Test that the array cross matches the PIL-drawn cross."""
+        cm = CameraManager(i2c_bus=1, mux_addr=0x24, camera_count=4, test_mode=True)
         
-        # In test mode it shouldn't call the hardware
-        assert not mocked_smbus.write_byte_data.called
+        # Draw the same cross on an image and on an array
+        image = _GREY_640.copy()
+        cm._add_center_cross(image)
+        frame = np.full((480, 640, 3), 100, dtype=np.uint8)
+        cm._stamp_center_cross(frame)
         
-        # Test broken camera 3
-        mocked_smbus.reset_mock()
-        result = cm.select_camera(3)
-        assert result is True
-        assert cm.current_camera == 3
-        # Should not have called the bus for camera 3 (broken)
-        assert not mocked_smbus.write_byte_data.called
+        # Both paths should produce identical pixels
+        assert (np.asarray(image) == frame).all()
+        assert tuple(frame[240, 320]) == (0, 255, 0)
         
         # Cleanup
         cm.cleanup()
     
-    def test_camera_cycle(self, mocked_smbus, mocked_picamera):
-        """Test camera cycling."""
-        # Use test_mode=True since we can't access actual hardware during tests
+    @patch('time.sleep')  # Mock sleep to speed up tests
+    def test_select_camera_skips_redundant_writes(self, mock_sleep):
+        """Test that reselecting the current channel doesn't touch the bus."""
         cm = CameraManager(i2c_bus=1, mux_addr=0x24, camera_count=4, test_mode=True)
         
-        # Initialize with mock picam
-        cm.initialize_camera(mock_picam=mocked_picamera)
+        # Exercise the hardware path against a mocked bus
+        cm.test_mode = False
+        cm.bus = MagicMock()
+        cm._mux_msgs = {index: MagicMock() for index in cm.CAMERA_COMMANDS}
         
-        # Start cycling
-        cm.start_camera_cycle(interval=0.01)  # Fast interval for testing
-        assert cm.is_cycling is True
+        assert cm.select_camera(1) is True
+        assert cm.select_camera(1) is True
+        cm.bus.i2c_rdwr.assert_called_once_with(cm._mux_msgs[1])
         
-        # Give it time to cycle at least once
-        import time
-        time.sleep(0.05)
+        # A different channel is written again
+        assert cm.select_camera(2) is True
+        assert cm.bus.i2c_rdwr.call_count == 2
         
-        # Just check that cycling is happening by looking at the interval
-        assert cm.cycle_interval == 0.01
+        # A failed write invalidates the cache
+        cm.bus.i2c_rdwr.side_effect = OSError("bus error")
+        assert cm.select_camera(1) is False
+        cm.bus.i2c_rdwr.side_effect = None
+        assert cm.select_camera(2) is True
+        assert cm.bus.i2c_rdwr.call_count == 4
         
-        # Stop cycling
-        cm.stop_camera_cycle()
-        assert cm.is_cycling is False
+        # force rewrites the current channel
+        assert cm.select_camera(2, force=True) is True
+        assert cm.bus.i2c_rdwr.call_count == 5
         
         # Cleanup
+        cm.test_mode = True
         cm.cleanup()
     
-    @patch('time.sleep')  # Mock sleep to speed up tests
-    def test_capture_image(self, mock_sleep, mocked_smbus, mocked_picamera):
-        """Test image capture."""
-        # Use test_mode=True since we can't access actual hardware during tests
+    @patch('time.sleep')
+    def test_select_camera_polls_mux_readback(self, mock_sleep):
+        """Test that a matching readback ends the settle wait immediately."""
         cm = CameraManager(i2c_bus=1, mux_addr=0x24, camera_count=4, test_mode=True)
+        cm.test_mode = False
+        cm.bus = MagicMock()
+        cm._mux_msgs = {index: MagicMock() for index in cm.CAMERA_COMMANDS}
+        cm.bus.read_byte_data.return_value = cm.CAMERA_COMMANDS[2]
         
-        # Initialize with mock picam
-        cm.initialize_camera(mock_picam=mocked_picamera)
+        assert cm.select_camera(2) is True
+        cm.bus.read_byte_data.assert_called_once_with(0x24, 0x24)
+        mock_sleep.assert_not_called()
         
-        # Test capture image - in test mode, it should return a test image directly
-        image = cm.capture_image(0)
-        assert isinstance(image, Image.Image)
+        # Cleanup
+        cm.test_mode = True
+        cm.cleanup()
+    
+    def test_concurrent_select_camera_serializes_bus_access(self):
+        """Test that selects from several threads never overlap on the I2C bus."""
+        from concurrent.futures import ThreadPoolExecutor
+        
+        cm = CameraManager(i2c_bus=1, mux_addr=0x24, camera_count=4, test_mode=True)
+        cm.test_mode = False
+        cm.bus = MagicMock()
+        cm._mux_msgs = {index: command for index, command in cm.CAMERA_COMMANDS.items()}
+        
+        # The mock mux echoes the last command written and records any overlap
+        state = {'mux': None, 'active': 0, 'overlap': False}
+        guard = threading.Lock()
+        def write(command):
+            with guard:
+                state['active'] += 1
+                state['overlap'] |= state['active'] > 1
+            state['mux'] = command
+            time.sleep(0.0005)  # Give other threads a chance to interleave
+            with guard:
+                state['active'] -= 1
+        cm.bus.i2c_rdwr.side_effect = write
+        cm.bus.read_byte_data.side_effect = lambda addr, reg: state['mux']
+        
+        indices = [0, 1, 2, 3] * 8
+        with ThreadPoolExecutor(max_workers=4) as pool:
+            results = list(pool.map(cm.select_camera, indices))
+        
+        assert all(results)
+        assert not state['overlap']
+        # The cached command always matches what the mux was last told
+        assert cm._last_mux_command == state['mux'] == cm.CAMERA_COMMANDS[cm.current_camera]
         
-        # Test capturing from broken camera 3
-        image = cm.capture_image(3)
+        # Cleanup
+        cm.test_mode = True
+        cm.cleanup()
+    
+    def test_capture_image_while_cycling(self):
+        """Test that capturing during four-in-one mode doesn't deadlock on the lock."""
+        cm = CameraManager(i2c_bus=1, mux_addr=0x24, camera_count=4, test_mode=True)
+        cm.start_camera_cycle()
+        
+        image = cm.capture_image(1)
         assert isinstance(image, Image.Image)
-        # Should have a black color (for the broken camera)
-        assert image.getpixel((0, 0))[0] == 0
+        
+        # Four-in-one mode is restored afterwards
+        assert cm.is_cycling
+        assert cm.current_camera == 'all'
         
         # Cleanup
         cm.cleanup()
     
-    @patch('time.sleep')  # Mock sleep to speed up tests
-    def test_capture_all_cameras(self, mock_sleep, mocked_smbus, mocked_picamera):
-        """Test capturing from all cameras."""
-        # Use test_mode=True since we can't access actual hardware during tests
+    def test_select_camera_does_not_wait_for_picam(self):
+        """Test that switching cameras only needs the I2C lock."""
         cm = CameraManager(i2c_bus=1, mux_addr=0x24, camera_count=4, test_mode=True)
         
-        # Initialize with mock picam
-        cm.initialize_camera(mock_picam=mocked_picamera)
+        # Hold the camera lock in another thread, as a preview capture would
+        held, release = threading.Event(), threading.Event()
+        def hold_picam_lock():
+            with cm._picam_lock:
+                held.set()
+                release.wait(5)
+        holder = threading.Thread(target=hold_picam_lock)
+        holder.start()
+        held.wait(5)
+        
+        try:
+            result = []
+            selector = threading.Thread(target=lambda: result.append(cm.select_camera(2)))
+            selector.start()
+            selector.join(2)
+            assert result == [True]
+            assert cm.current_camera == 2
+        finally:
+            release.set()
+            holder.join()
+        
+        # Cleanup
+        cm.cleanup()
+    
+    def test_bad_cameras_get_placeholder(self):
+        """Test that cameras marked bad are skipped and replaced by a placeholder."""
+        cm = CameraManager(i2c_bus=1, mux_addr=0x24, camera_count=4, bad_cameras={2}, test_mode=True)
         
-        # Capture from all cameras
         images = cm.capture_all_cameras()
+        assert len(images) == 4
+        assert images[2].getpixel((0, 0)) == (0, 0, 0)
+        assert images[1].getpixel((0, 0)) == (100, 150, 200)
+        
+        # The broken set and the capture order are exposed read-only
+        assert cm.broken_cameras == frozenset({2})
+        assert cm.capture_cameras == (0, 1, 3)
+        
+        # A bad camera is never selected
+        image = cm.capture_image(2)
+        assert image.getpixel((0, 0)) == (0, 0, 0)
+        assert cm.current_camera != 2
+        
+        # The placeholder is rendered once and handed out as copies
+        assert image is not images[2]
+        assert image.tobytes() == images[2].tobytes()
+        
+        # Cleanup
+        cm.cleanup()
+    
+    def test_dual_stream_skips_mode_switch(self):
+        """Test that dual-stream mode captures stills without reconfiguring."""
+        cm = CameraManager(i2c_bus=1, mux_addr=0x24, camera_count=4, dual_stream=True, test_mode=True)
+        assert cm.preview_stream == "lores"
+        assert cm.still_config is cm.video_config
+        
+        cm.picam.reset_mock()
+        request = cm._capture_still_request()
+        assert request is cm.picam.capture_request.return_value
+        cm.picam.switch_mode_and_capture_request.assert_not_called()
+        
+        # Cleanup
+        cm.cleanup()
+    
+    def test_dual_stream_capture_skips_focus_timeout(self):
+        """Test that a dual-stream capture sequence accepts continuous focus instead of timing out."""
+        # The hardware path reads frames through picamera2's MappedArray
+        pytest.importorskip('picamera2')
+        cm = CameraManager(i2c_bus=1, mux_addr=0x24, camera_count=4, bad_cameras={3},
+                           af_settle=5.0, dual_stream=True, test_mode=True)
+        cm.test_mode = False
+        cm.bus = MagicMock()
+        cm._mux_msgs = {index: command for index, command in cm.CAMERA_COMMANDS.items()}
+        
+        # The mock mux echoes the last command; continuous autofocus is already locked
+        mux = {}
+        cm.bus.i2c_rdwr.side_effect = lambda command: mux.update(command=command)
+        cm.bus.read_byte_data.side_effect = lambda addr, reg: mux.get('command')
+        cm.picam.capture_metadata.return_value = {"AfState": cm._controls.AfStateEnum.Focused}
+        
+        class FakeMappedArray:
+            def __init__(self, request, stream):
+                self.array = np.zeros((48, 64, 3), dtype=np.uint8)
+            def __enter__(self):
+                return self
+            def __exit__(self, *exc_info):
+                return False
+        
+        with patch('picamera2.MappedArray', FakeMappedArray), \
+             patch('camera_manager.logger') as mock_logger:
+            started = time.monotonic()
+            images = cm.capture_all_cameras()
+            elapsed = time.monotonic() - started
         
-        # Should have returned 4 images
         assert len(images) == 4
-        assert all(isinstance(img, Image.Image) for img in images)
+        assert elapsed < cm.af_settle
+        cm.picam.set_controls.assert_not_called()
+        assert not any('did not converge' in str(c.args[0]) for c in mock_logger.warning.call_args_list)
         
-        # Camera 4 (index 3) should be black (broken camera)
-        assert images[3].getpixel((0, 0))[0] == 0
+        # Cleanup
+        cm.test_mode = True
+        cm.cleanup()
+    
+    def test_capture_jpeg_to_file(self, tmp_path):
+        """Test that capture_jpeg writes a JPEG file."""
+        with CameraManager(i2c_bus=1, mux_addr=0x24, camera_count=4, test_mode=True) as cm:
+            path = tmp_path / "still.jpg"
+            written = cm.capture_jpeg(str(path), 1)
+            assert written == path.stat().st_size
+            
+            with Image.open(path) as image:
+                assert image.format == 'JPEG'
+                assert image.size == (640, 480)
+    
+    def test_context_manager_cleans_up(self):
+        """Test that leaving a with block cleans up, even on error."""
+        with patch.object(CameraManager, 'cleanup') as mock_cleanup:
+            with pytest.raises(RuntimeError):
+                with CameraManager(i2c_bus=1, mux_addr=0x24, camera_count=4, test_mode=True):
+                    raise RuntimeError("boom")
+            mock_cleanup.assert_called_once_with()
+    
+    def test_wait_for_focus_returns_once_focused(self):
+        """Test that the autofocus wait ends on the first focused frame after a scan."""
+        cm = CameraManager(i2c_bus=1, mux_addr=0x24, camera_count=4, test_mode=True)
+        states = cm._controls.AfStateEnum
+        cm.picam.capture_metadata.side_effect = [
+            {"AfState": states.Focused},  # Left over from before the trigger
+            {"AfState": states.Scanning},
+            {"AfState": states.Focused},
+        ]
+        
+        assert cm._wait_for_focus(5.0) is True
+        assert cm.picam.capture_metadata.call_count == 3
+        cm.picam.set_controls.assert_called_once_with({"AfTrigger": cm._controls.AfTriggerEnum.Start})
         
         # Cleanup
         cm.cleanup()
     
-    def test_create_grid_image(self, test_images):
-        """Test grid image creation."""
+    @pytest.mark.parametrize('states, polls', [
+        (['Focused'], 1),
+        (['Failed', 'Scanning', 'Focused'], 3),
+    ], ids=['already_focused', 'rescans_after_failure'])
+    def test_wait_for_focus_continuous(self, states, polls):
+        """Test that continuous autofocus is not triggered and accepts any focused frame."""
+        cm = CameraManager(i2c_bus=1, mux_addr=0x24, camera_count=4, dual_stream=True, test_mode=True)
+        assert cm._still_af_mode == cm._controls.AfModeEnum.Continuous
+        enum = cm._controls.AfStateEnum
+        cm.picam.capture_metadata.side_effect = [{"AfState": getattr(enum, state)} for state in states]
+        
+        assert cm._wait_for_focus(5.0) is True
+        assert cm.picam.capture_metadata.call_count == polls
+        cm.picam.set_controls.assert_not_called()
+        
+        # Cleanup
+        cm.cleanup()
+    
+    def test_capture_jpeg_bytes(self):
+        """Test that capture_jpeg_bytes returns a decodable JPEG."""
         cm = CameraManager(i2c_bus=1, mux_addr=0x24, camera_count=4, test_mode=True)
         
-        # Create a grid from test images
-        grid = cm.create_grid_image(test_images)
+        data = cm.capture_jpeg_bytes(1)
+        assert data[:2] == b'\xff\xd8'
         
-        # Check grid dimensions
-        assert isinstance(grid, Image.Image)
-        assert grid.width == test_images[0].width * 2
-        assert grid.height == test_images[0].height * 2
+        image = Image.open(io.BytesIO(data))
+        assert image.format == 'JPEG'
+        assert image.size == (640, 480)
         
         # Cleanup
         cm.cleanup()
     
-    def test_add_center_cross(self, mocked_smbus, mocked_picamera):
-        """Test adding center cross to image."""
+    def test_capture_preview_image(self):
+        """Test that preview frames come back as RGB images with the stamp applied."""
         cm = CameraManager(i2c_bus=1, mux_addr=0x24, camera_count=4, test_mode=True)
         
-        # Create a test image
-        image = Image.new('RGB', (640, 480), color=(100, 100, 100))
+        def stamp(frame):
+            frame[0, 0] = (255, 0, 0)
         
-        # Add a cross to it
-        cm._add_center_cross(image)
+        image = cm.capture_preview_image(stamp=stamp)
+        assert image.mode == 'RGB'
+        assert image.size == (640, 480)
+        assert image.getpixel((0, 0)) == (255, 0, 0)
+        assert image.getpixel((320, 240)) == (100, 150, 200)
         
-        # We can't easily check the pixels, but we can make sure it doesn't crash
-        assert isinstance(image, Image.Image)
+        # Without a stamp the frame is returned untouched
+        assert cm.capture_preview_image().getpixel((0, 0)) == (100, 150, 200)
         
         # Cleanup
         cm.cleanup()
+    
+    def test_encode_frame_jpeg_without_simplejpeg(self):
+        """Test that frames are still encoded through PIL when simplejpeg is missing."""
+        cm = CameraManager(i2c_bus=1, mux_addr=0x24, camera_count=4, test_mode=True)
+        
+        # A None entry makes the import fail even where simplejpeg is installed
+        frame = np.dstack([np.full((480, 640, 3), 100, np.uint8), np.zeros((480, 640), np.uint8)])
+        with patch.dict('sys.modules', {'simplejpeg': None}):
+            data = cm._encode_frame_jpeg(frame, 90)
+        
+        image = Image.open(io.BytesIO(data))
+        assert image.format == 'JPEG'
+        assert image.mode == 'RGB'
+        assert image.size == (640, 480)
+        
+        # Cleanup
+        cm.cleanup()
+    
+    @pytest.mark.parametrize('gray_stream, size', [(False, (1280, 720)), (True, (640, 480))],
+                             ids=['preview', 'yuv_lores'])
+    def test_capture_gray(self, gray_stream, size):
+        """Test that the YUV420 lores stream is only configured when asked for."""
+        with patch.dict('camera_manager.CONFIG', {'GRAY_STREAM': gray_stream}):
+            cm = CameraManager(i2c_bus=1, mux_addr=0x24, camera_count=4, test_mode=True)
+        
+        video_streams = cm.picam.create_video_configuration.call_args.kwargs
+        assert ('lores' in video_streams) == gray_stream
+        
+        image = cm.capture_gray()
+        assert image.mode == 'L'
+        assert image.size == size
+        
+        # Cleanup
+        cm.cleanup()
+    
+    def test_post_worker_survives_processing_errors(self):
+        """Test that a failure in post-processing still yields an image and keeps the worker alive."""
+        cm = CameraManager(i2c_bus=1, mux_addr=0x24, camera_count=4, test_mode=True)
+        cm._start_post_worker()
+        
+        frame = np.full((480, 640, 3), 100, dtype=np.uint8)
+        with patch.object(cm, '_process_frame', side_effect=MemoryError("out of memory")):
+            cm._post_queue.put((0, frame, None))
+            image = cm._result_queue.get(timeout=5)
+        assert image.getpixel((0, 0)) == (0, 0, 0)
+        
+        # The same worker goes on to process the next frame normally
+        assert cm._post_worker.is_alive()
+        cm._post_queue.put((1, frame.copy(), None))
+        assert cm._result_queue.get(timeout=5).getpixel((0, 0)) == (100, 100, 100)
+        
+        # Cleanup
+        cm.cleanup()
+    
+    def test_stop_post_worker_does_not_hang_on_stalled_worker(self):
+        """Test that stopping a stalled worker with a full queue gives up instead of blocking."""
+        cm = CameraManager(i2c_bus=1, mux_addr=0x24, camera_count=4, test_mode=True)
+        cm._start_post_worker()
+        stalled_jobs = cm._post_queue
+        
+        # The worker blocks on its first frame while two more fill the queue
+        release = threading.Event()
+        frame = np.zeros((4, 4, 3), dtype=np.uint8)
+        def stall(*args):
+            release.wait()
+            return _GREY_640
+        with patch.object(cm, '_process_frame', side_effect=stall):
+            for i in range(3):
+                stalled_jobs.put((i, frame, None), timeout=5)
+            worker = cm._post_worker
+            with patch.dict('camera_manager.CONFIG', {'POST_PROCESS_TIMEOUT': 0.05}):
+                started = time.monotonic()
+                cm._stop_post_worker()
+            assert time.monotonic() - started < 1
+            
+            # The worker was abandoned and the next run gets fresh queues
+            assert cm._post_worker is None
+            assert cm._post_queue is not stalled_jobs
+            
+            # Let the stalled worker finish its backlog and exit
+            release.set()
+            stalled_jobs.put(None, timeout=5)
+            worker.join(5)
+        assert not worker.is_alive()
+        
+        # Cleanup
+        cm.cleanup()
+    
+    @pytest.mark.parametrize('denied', [None, 'sched_setaffinity', 'sched_setscheduler'])
+    def test_realtime_priority(self, denied):
+        """Test that capture scheduling is restored afterwards and a denied switch still runs the block."""
+        cm = CameraManager(i2c_bus=1, mux_addr=0x24, camera_count=4, test_mode=True)
+        cm.test_mode = False
+        
+        saved_param = MagicMock()
+        sched = {
+            'sched_getaffinity': MagicMock(return_value={0, 1, 2, 3}),
+            'sched_setaffinity': MagicMock(),
+            'sched_getscheduler': MagicMock(return_value=0),
+            'sched_getparam': MagicMock(return_value=saved_param),
+            'sched_setscheduler': MagicMock(),
+            'sched_param': MagicMock(side_effect=lambda priority: ('param', priority)),
+            'SCHED_FIFO': 1,
+        }
+        if denied:
+            sched[denied].side_effect = [PermissionError(1, "Operation not permitted"), None]
+        
+        ran = False
+        with patch.dict('camera_manager.CONFIG', {'REALTIME_CAPTURE': True, 'CAPTURE_CPU': 3, 'CAPTURE_RT_PRIORITY': 20}), \
+             patch.multiple('camera_manager.os', create=True, **sched), \
+             patch('camera_manager.logger') as mock_logger:
+            with cm._realtime_priority():
+                ran = True
+        assert ran
+        
+        affinity_calls = [c.args for c in sched['sched_setaffinity'].call_args_list]
+        policy_calls = [c.args for c in sched['sched_setscheduler'].call_args_list]
+        if denied == 'sched_setaffinity':
+            # Only the pin attempt was made; nothing to restore
+            assert affinity_calls == [(0, {3})]
+        else:
+            assert affinity_calls == [(0, {3}), (0, {0, 1, 2, 3})]
+        if denied == 'sched_setscheduler':
+            assert policy_calls == [(0, 1, ('param', 20))]
+        else:
+            assert policy_calls == [(0, 1, ('param', 20)), (0, 0, saved_param)]
+        assert mock_logger.warning.call_count == (1 if denied else 0)
+        mock_logger.error.assert_not_called()
+        
+        # Cleanup
+        cm.test_mode = True
+        cm.cleanup()
+
+class TestFrameServer:
+    """Test suite for the FrameServer preview ring."""
+    
+    @pytest.fixture
+    def server(self):
+        """Create a three-slot FrameServer whose camera grab writes numbered frames."""
+        cm = CameraManager(i2c_bus=1, mux_addr=0x24, camera_count=4, test_mode=True)
+        server = FrameServer(cm, slots=3)
+        server.grabbed = []
+        
+        # Stand-in for the picamera2 grab: reuse each slot, as the real one does
+        def capture_into(index):
+            server.grabbed.append(index)
+            if server._slots[index] is None:
+                server._slots[index] = np.zeros((4, 4, 3), dtype=np.uint8)
+            server._slots[index][:] = len(server.grabbed)
+        
+        with patch.object(server, '_capture_into', side_effect=capture_into):
+            yield server
+        server.stop()
+        cm.cleanup()
+    
+    def test_ring_rotation(self, server):
+        """Test that each wait gets a newer frame, written round the ring of slots."""
+        server.start()
+        frames, values = [], []
+        for _ in range(4):
+            frame = server.wait_for_frame(timeout=5)
+            frames.append(frame)
+            values.append(int(frame[0, 0, 0]))
+        
+        assert values == [1, 2, 3, 4]
+        assert server.grabbed == [1, 2, 0, 1]
+        # The fourth frame reused the first one's slot
+        assert frames[3] is frames[0]
+    
+    def test_wait_times_out_without_frames(self, server):
+        """Test that readers get None instead of blocking when no frame arrives."""
+        # Not started, so nothing is ever published
+        assert server.wait_for_frame(timeout=0.05) is None
+        
+        # During a still capture readers don't wait, or ask for a frame, at all
+        server.start()
+        server.wait_for_frame(timeout=5)
+        grabbed = len(server.grabbed)
+        with server.camera_manager._still_capture():
+            started = time.monotonic()
+            assert server.wait_for_frame(timeout=5) is None
+            assert time.monotonic() - started < 1
+        assert len(server.grabbed) == grabbed
+    
+    def test_stop(self, server):
+        """Test that stopping ends the capture thread and releases waiting readers."""
+        # A reader waiting for a frame that never comes is woken by stop()
+        result = []
+        reader = threading.Thread(target=lambda: result.append(server.wait_for_frame(timeout=10)))
+        reader.start()
+        time.sleep(0.05)
+        started = time.monotonic()
+        server.stop()
+        reader.join(5)
+        assert result == [None]
+        assert time.monotonic() - started < 1
+        
+        # A running capture thread exits, and later readers return straight away
+        server.start()
+        thread = server._thread
+        assert server.wait_for_frame(timeout=5) is not None
+        server.stop()
+        assert not thread.is_alive()
+        assert server._thread is None
+        assert server.wait_for_frame(timeout=5) is None
+        
+        # Restarting doesn't act on the wake-up left by stop() or the stopped reader
+        grabbed = len(server.grabbed)
+        server.start()
+        time.sleep(0.05)
+        assert len(server.grabbed) == grabbed
@@ -2,13 +2,27 @@
 Tests for the Flask application routes
 """
 import pytest
+import io
 import os
-import json
 from unittest.mock import patch, MagicMock
 from PIL import Image
 
 import cam
 
+# These tests only check file and HTTP plumbing, so keep anything that gets
+# JPEG-encoded tiny: a 16x16 frame for routes that save, and one pre-encoded
+# 1x1 JPEG to drop into the captures folder
+_TINY_FRAME = Image.new('RGB', (16, 16), color=(100, 150, 200))
+_TINY_GRID = Image.new('RGB', (32, 32), color=(200, 200, 200))
+_jpeg_buffer = io.BytesIO()
+Image.new('RGB', (1, 1), color=(150, 150, 150)).save(_jpeg_buffer, format='JPEG')
+_TINY_JPEG = _jpeg_buffer.getvalue()
+
+def write_tiny_jpeg(path):
+    """Write the pre-encoded 1x1 JPEG to path."""
+    with open(path, 'wb') as f:
+        f.write(_TINY_JPEG)
+
 class TestFlaskApp:
     """Test suite for Flask application routes."""
     
@@ -18,138 +32,129 @@ class TestFlaskApp:
         assert response.status_code == 200
         assert b'multicam view' in response.data
     
-    def test_camera_info_route(self, app, mock_camera_manager):
+    def test_camera_info_route(self, app, patched_cm):
         """Test the camera_info route."""
         # Set up mock properties
-        mock_camera_manager.camera_count = 4
-        mock_camera_manager.current_camera = 1
-        mock_camera_manager.is_cycling = True
-        mock_camera_manager.cycle_interval = 2.0
-        
-        # Set the app's camera_manager to our mock
-        old_cm = cam.camera_manager
-        cam.camera_manager = mock_camera_manager
-        
-        try:
-            response = app.get('/camera_info')
-            data = json.loads(response.data)
-            
-            assert response.status_code == 200
-            assert data['success'] is True
-            assert data['camera_count'] == 4
-            assert data['current_camera'] == 1
-            assert data['cycling'] is True
-            assert data['cycle_interval'] == 2.0
-        finally:
-            # Restore the original camera_manager
-            cam.camera_manager = old_cm
+        patched_cm.camera_count = 4
+        patched_cm.current_camera = 1
+        patched_cm.is_cycling = True
+        patched_cm.cycle_interval = 2.0
+        
+        response = app.get('/camera_info')
+        data = response.get_json()
+        
+        assert response.status_code == 200
+        assert data['success'] is True
+        assert data['camera_count'] == 4
+        assert data['current_camera'] == 1
+        assert data['cycling'] is True
+        assert data['cycle_interval'] == 2.0
     
-    def test_select_camera_route(self, app, mock_camera_manager):
+    def test_select_camera_route(self, app, patched_cm):
         """Test the select_camera route."""
         # Set up mock behavior
-        mock_camera_manager.select_camera.return_value = True
-        mock_camera_manager.is_cycling = True
-        
-        # Set the app's camera_manager to our mock
-        old_cm = cam.camera_manager
-        cam.camera_manager = mock_camera_manager
-        
-        try:
-            response = app.get('/select_camera/2')
-            data = json.loads(response.data)
-            
-            assert response.status_code == 200
-            assert data['success'] is True
-            assert data['camera'] == 2
-            
-            # Should have called select_camera with camera_id 2
-            mock_camera_manager.select_camera.assert_called_with(2)
-            
-            # Should have stopped cycling
-            mock_camera_manager.stop_camera_cycle.assert_called_once()
-        finally:
-            # Restore the original camera_manager
-            cam.camera_manager = old_cm
+        patched_cm.select_camera.return_value = True
+        patched_cm.is_cycling = True
+        
+        response = app.get('/select_camera/2')
+        data = response.get_json()
+        
+        assert response.status_code == 200
+        assert data['success'] is True
+        assert data['camera'] == 2
+        
+        # Should have called select_camera with camera_id 2
+        patched_cm.select_camera.assert_called_with(2)
+        
+        # Should have stopped cycling
+        patched_cm.stop_camera_cycle.assert_called_once()
     
-    def test_toggle_cycle_route(self, app, mock_camera_manager):
+    def test_toggle_cycle_route(self, app, patched_cm):
         """Test the toggle_cycle route."""
         # Test stopping cycling
-        mock_camera_manager.is_cycling = True
-        
-        # Set the app's camera_manager to our mock
-        old_cm = cam.camera_manager
-        cam.camera_manager = mock_camera_manager
-        
-        try:
-            response = app.get('/toggle_cycle')
-            data = json.loads(response.data)
-            
-            assert response.status_code == 200
-            assert data['success'] is True
-            assert data['status'] == 'stopped'
-            
-            # Should have called stop_camera_cycle
-            mock_camera_manager.stop_camera_cycle.assert_called_once()
-            
-            # Test starting cycling
-            mock_camera_manager.reset_mock()
-            mock_camera_manager.is_cycling = False
-            
-            response = app.get('/toggle_cycle')
-            data = json.loads(response.data)
-            
-            assert response.status_code == 200
-            assert data['success'] is True
-            assert data['status'] == 'started'
-            
-            # Should have called start_camera_cycle
-            mock_camera_manager.start_camera_cycle.assert_called_once()
-        finally:
-            # Restore the original camera_manager
-            cam.camera_manager = old_cm
+        patched_cm.is_cycling = True
+        
+        response = app.get('/toggle_cycle')
+        data = response.get_json()
+        
+        assert response.status_code == 200
+        assert data['success'] is True
+        assert data['status'] == 'stopped'
+        
+        # Should have called stop_camera_cycle
+        patched_cm.stop_camera_cycle.assert_called_once()
+        
+        # Test starting cycling
+        patched_cm.reset_mock()
+        patched_cm.is_cycling = False
+        
+        response = app.get('/toggle_cycle')
+        data = response.get_json()
+        
+        assert response.status_code == 200
+        assert data['success'] is True
+        assert data['status'] == 'started'
+        
+        # Should have called start_camera_cycle
+        patched_cm.start_camera_cycle.assert_called_once()
     
-    def test_capture_route(self, app, mock_camera_manager, test_images):
+    @pytest.mark.parametrize('save_workers', [1, 2], ids=['inline_saves', 'parallel_saves'])
+    def test_capture_route(self, app, patched_cm, monkeypatch, save_workers):
         """Test the capture route."""
-        # Set up mock behavior
-        mock_camera_manager.capture_all_cameras.return_value = test_images
+        monkeypatch.setitem(cam.APP_CONFIG, 'SAVE_WORKERS', save_workers)
+        
+        # Set up mock behavior; the route saves these, so they're kept small
+        patched_cm.capture_all_cameras.side_effect = None
+        patched_cm.capture_all_cameras.return_value = [_TINY_FRAME] * 4
         
         # Create mock grid image
-        grid_img = Image.new('RGB', (1280, 960), color=(200, 200, 200))
-        mock_camera_manager.create_grid_image.return_value = grid_img
-        
-        # Set the app's camera_manager to our mock
-        old_cm = cam.camera_manager
-        cam.camera_manager = mock_camera_manager
-        
-        try:
-            response = app.get('/capture')
-            data = json.loads(response.data)
-            
-            assert response.status_code == 200
-            assert data['success'] is True
-            assert 'filenames' in data
-            assert 'grid_filename' in data
-            assert len(data['filenames']) == 4
-            
-            # Check that capture_all_cameras was called
-            mock_camera_manager.capture_all_cameras.assert_called_once()
-            
-            # Check that create_grid_image was called with our test images
-            mock_camera_manager.create_grid_image.assert_called_once()
-            
-            # Check that the images were saved to the captures directory
-            captures_dir = app.application.config['CAPTURE_FOLDER']
-            
-            # Should have saved 5 files (4 individual + 1 grid)
-            saved_files = os.listdir(captures_dir)
-            assert len(saved_files) == 5
-            
-            # At least one file should be a grid file
-            grid_files = [f for f in saved_files if '_grid.jpg' in f]
-            assert len(grid_files) == 1
-        finally:
-            # Restore the original camera_manager
-            cam.camera_manager = old_cm
+        patched_cm.create_grid_image.side_effect = None
+        patched_cm.create_grid_image.return_value = _TINY_GRID
+        
+        response = app.get('/capture')
+        data = response.get_json()
+        
+        assert response.status_code == 200
+        assert data['success'] is True
+        assert 'filenames' in data
+        assert 'grid_filename' in data
+        assert len(data['filenames']) == 4
+        
+        # Check that capture_all_cameras was called
+        patched_cm.capture_all_cameras.assert_called_once()
+        
+        # Check that create_grid_image was called with our test images
+        patched_cm.create_grid_image.assert_called_once()
+        
+        # Check that the images were saved to the captures directory
+        captures_dir = app.application.config['CAPTURE_FOLDER']
+        
+        # Should have saved 5 files (4 individual + 1 grid)
+        saved_files = os.listdir(captures_dir)
+        assert len(saved_files) == 5
+        
+        # At least one file should be a grid file
+        grid_files = [f for f in saved_files if '_grid.jpg' in f]
+        assert len(grid_files) == 1
+    
+    def test_capture_route_reports_unwritten_grid(self, app, patched_cm, monkeypatch):
+        """Test that a grid file missing after the save isn't reported as saved."""
+        patched_cm.capture_all_cameras.side_effect = None
+        patched_cm.capture_all_cameras.return_value = [_TINY_FRAME] * 4
+        patched_cm.create_grid_image.side_effect = None
+        patched_cm.create_grid_image.return_value = _TINY_GRID
+        
+        # The grid write "succeeds" but the file isn't there afterwards
+        stat_or_none = cam.stat_or_none
+        monkeypatch.setattr(cam, 'stat_or_none',
+                            lambda path: None if path.endswith('_grid.jpg') else stat_or_none(path))
+        
+        response = app.get('/capture')
+        data = response.get_json()
+        
+        assert response.status_code == 200
+        assert len(data['filenames']) == 4
+        assert data['grid_filename'] is None
     
     def test_latest_capture_route(self, app):
         """Test the latest_capture route."""
@@ -158,12 +163,11 @@ class TestFlaskApp:
         test_grid_file = os.path.join(captures_dir, 'capture_1_grid.jpg')
         
         # Create a simple test image
-        test_img = Image.new('RGB', (100, 100), color=(150, 150, 150))
-        test_img.save(test_grid_file)
+        write_tiny_jpeg(test_grid_file)
         
         # Test the route
         response = app.get('/latest_capture')
-        data = json.loads(response.data)
+        data = response.get_json()
         
         assert response.status_code == 200
         assert data['success'] is True
@@ -182,8 +186,7 @@ class TestFlaskApp:
         test_file = os.path.join(captures_dir, 'test_image.jpg')
         
         # Create a simple test image
-        test_img = Image.new('RGB', (100, 100), color=(150, 150, 150))
-        test_img.save(test_file)
+        write_tiny_jpeg(test_file)
         
         # Test the route
         response = app.get('/captures/test_image.jpg')
@@ -202,12 +205,11 @@ class TestFlaskApp:
         test_file = os.path.join(captures_dir, 'test_debug.jpg')
         
         # Create a simple test image
-        test_img = Image.new('RGB', (100, 100), color=(150, 150, 150))
-        test_img.save(test_file)
+        write_tiny_jpeg(test_file)
         
         # Test the route
         response = app.get('/debug/captures')
-        data = json.loads(response.data)
+        data = response.get_json()
         
         assert response.status_code == 200
         assert data['success'] is True
@@ -216,34 +218,42 @@ class TestFlaskApp:
         assert len(data['files']) == 1
         assert data['files'][0]['name'] == 'test_debug.jpg'
     
-    def test_debug_test_capture_route(self, app, mock_camera_manager):
+    def test_capture_jpeg_route(self, app, patched_cm):
+        """Test the capture_jpeg route."""
+        # Set up mock behavior
+        patched_cm.capture_jpeg_bytes.return_value = b'\xff\xd8test\xff\xd9'
+        
+        response = app.get('/capture_jpeg/1')
+        
+        assert response.status_code == 200
+        assert response.mimetype == 'image/jpeg'
+        assert response.data == b'\xff\xd8test\xff\xd9'
+        patched_cm.capture_jpeg_bytes.assert_called_with(1)
+        
+        # Out-of-range cameras are rejected
+        response = app.get('/capture_jpeg/9')
+        assert response.status_code == 400
+    
+    def test_debug_test_capture_route(self, app, patched_cm):
         """Test the debug_test_capture route."""
         # Set up mock behavior
-        test_img = Image.new('RGB', (640, 480), color=(100, 100, 100))
-        mock_camera_manager.capture_image.return_value = test_img
-        
-        # Set the app's camera_manager to our mock
-        old_cm = cam.camera_manager
-        cam.camera_manager = mock_camera_manager
-        
-        try:
-            response = app.get('/debug/test_capture')
-            data = json.loads(response.data)
-            
-            assert response.status_code == 200
-            assert data['success'] is True
-            assert 'file' in data
-            
-            # Should have called capture_image with camera 0
-            mock_camera_manager.capture_image.assert_called_with(0)
-            
-            # Should have saved the file
-            captures_dir = app.application.config['CAPTURE_FOLDER']
-            saved_files = os.listdir(captures_dir)
-            assert len(saved_files) == 1
-            
-            # File should match the one in the response
-            assert saved_files[0] == data['file']['filename']
-        finally:
-            # Restore the original camera_manager
-            cam.camera_manager = old_cm
+        patched_cm.capture_image.side_effect = None
+        patched_cm.capture_image.return_value = _TINY_FRAME
+        
+        response = app.get('/debug/test_capture')
+        data = response.get_json()
+        
+        assert response.status_code == 200
+        assert data['success'] is True
+        assert 'file' in data
+        
+        # Should have called capture_image with camera 0
+        patched_cm.capture_image.assert_called_with(0)
+        
+        # Should have saved the file
+        captures_dir = app.application.config['CAPTURE_FOLDER']
+        saved_files = os.listdir(captures_dir)
+        assert len(saved_files) == 1
+        
+        # File should match the one in the response
+        assert saved_files[0] == data['file']['filename']